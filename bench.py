@@ -0,0 +1,394 @@
+# ⏱️ 벤치마크: 가짜 디스코드/가짜 시트로 봇 핸들러를 그대로 돌려 지연과 왕복 횟수를 잰다
+#   python bench.py                          # 보고만
+#   python bench.py --check                  # 정산 불변식이 깨지거나 bench_baseline.json 보다 왕복이 늘면 종료 코드 1
+#   python bench.py --save-baseline          # 현재 결과를 기준값으로 저장
+#   python bench.py --backend sheets --games 500 --tables 16 --sheet-ms 80 --discord-ms 30
+#
+# 인원 선택 → !참가 → 히트/스테이/A값 버튼 → 정산까지 실제 콜백(main.py)을 호출한다.
+# 시트 호출은 스토리지 스레드에서 time.sleep, 디스코드 REST는 asyncio.sleep 으로 지연을 넣고
+# 메서드별로 센다. 기준값 비교는 횟수만 (지연은 기계마다 달라서 보고만 한다).
+# 끝나면 정산 불변식도 확인한다: 판마다 증감 = ±베팅, 유저 잔액 = 시작 잔액 + 전적 증감 합,
+# 남은 예치금/저널 행 없음.
+import argparse, asyncio, itertools, json, os, random, shutil, sys, tempfile, time, threading
+from collections import Counter
+
+SEED_BALANCE = 10**9
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+GATED = ("sheets_calls_per_game", "storage_calls_per_game", "journal_writes_per_game",
+         "discord_calls_per_game", "discord_calls_per_action")
+
+# ─────────────────────────────────────────────
+# 📊 가짜 워크시트 ("소지금" 시트: ID / 이름 / 소지금 / 시간)
+# ─────────────────────────────────────────────
+class FakeWorksheet:
+    def __init__(self, rows, latency=0.0):
+        self.rows = [list(map(str, r)) for r in rows]
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return [list(r) for r in self.rows]
+
+    def col_values(self, col):
+        self._call("col_values")
+        return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def get(self, rng):
+        # "A{a}:A{b}" 만 사용 (색인 재검증)
+        self._call("get")
+        a, b = (int(x.lstrip("A")) for x in rng.split(":"))
+        return [[self.rows[i - 1][0]] for i in range(a, b + 1) if i <= len(self.rows)]
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        for d in data:
+            start = d["range"].split(":")[0]
+            col, row = ord(start[0]) - ord("A"), int(start[1:])
+            for i, vals in enumerate(d["values"]):
+                r = self.rows[row - 1 + i]
+                r.extend([""] * (col + len(vals) - len(r)))
+                r[col:col + len(vals)] = map(str, vals)
+
+    def update(self, values, range_name="A1", **kw):
+        self._call("update")
+        start = range_name.split(":")[0]
+        col, row = ord(start[0]) - ord("A"), int(start[1:])
+        for i, vals in enumerate(values):
+            while len(self.rows) < row + i:
+                self.rows.append([])
+            r = self.rows[row - 1 + i]
+            r.extend([""] * (col + len(vals) - len(r)))
+            r[col:col + len(vals)] = map(str, vals)
+
+    def batch_clear(self, ranges):
+        self._call("batch_clear")
+        for rng in ranges:
+            a, b = (int(x.lstrip("ABCD")) for x in rng.split(":"))
+            for i in range(a, min(b, len(self.rows)) + 1):
+                self.rows[i - 1] = ["", "", "", ""]
+        while self.rows and not any(self.rows[-1]):
+            self.rows.pop()
+
+    def append_rows(self, rows, **kw):
+        self._call("append_rows")
+        start = len(self.rows) + 1
+        self.rows += [list(map(str, r)) for r in rows]
+        return {"updates": {"updatedRange": f"'소지금'!A{start}:D{len(self.rows)}"}}
+
+# ─────────────────────────────────────────────
+# 💬 가짜 디스코드 (Interaction / TextChannel / Context)
+# ─────────────────────────────────────────────
+class FakeDiscord:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def rest(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+class FakeMember:
+    def __init__(self, uid):
+        self.id, self.display_name, self.mention = uid, f"p{uid}", f"<@{uid}>"
+
+class FakeGuild:
+    def __init__(self, members, gid=1):
+        self.id, self.members = gid, {m.id: m for m in members}
+
+    def get_member(self, uid):
+        return self.members.get(uid)
+
+class FakeChannel:
+    def __init__(self, cid, guild, api):
+        self.id, self.guild, self.api = cid, guild, api
+
+    async def send(self, *a, **kw):
+        await self.api.rest("channel.send")
+
+class FakeResponse:
+    def __init__(self, api):
+        self.api, self.done = api, False
+
+    def is_done(self):
+        return self.done
+
+    async def _respond(self, name):
+        if self.done:
+            raise RuntimeError("interaction already responded")
+        self.done = True
+        await self.api.rest(name)
+
+    async def send_message(self, *a, **kw):
+        await self._respond("response.send_message")
+
+    async def edit_message(self, *a, **kw):
+        await self._respond("response.edit_message")
+
+    async def defer(self, *a, **kw):
+        await self._respond("response.defer")
+
+class FakeFollowup:
+    def __init__(self, api):
+        self.api = api
+
+    async def send(self, *a, **kw):
+        await self.api.rest("followup.send")
+
+class FakeInteraction:
+    ids = itertools.count(1)
+
+    def __init__(self, channel, user):
+        self.id = next(self.ids)
+        self.channel, self.guild, self.user = channel, channel.guild, user
+        self.response = FakeResponse(channel.api)
+        self.followup = FakeFollowup(channel.api)
+
+    async def edit_original_response(self, **kw):
+        await self.channel.api.rest("edit_original_response")
+
+class FakeContext:
+    def __init__(self, channel, author):
+        self.channel, self.guild, self.author = channel, channel.guild, author
+
+    async def send(self, *a, **kw):
+        await self.channel.send(*a, **kw)
+
+# ─────────────────────────────────────────────
+# 🎮 게임 진행: 자리 순서대로 기준 점수 미만이면 히트
+# ─────────────────────────────────────────────
+def pct(xs, q):
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+class Bench:
+    def __init__(self, casino, api, threshold=17, bet=10):
+        self.m, self.api = casino, api
+        self.threshold, self.bet = threshold, bet
+        self.lat = {}  # 동작 -> [초]
+        self.actions = 0
+
+    async def timed(self, op, coro):
+        t0 = time.perf_counter()
+        await coro
+        self.lat.setdefault(op, []).append(time.perf_counter() - t0)
+
+    async def game(self, ch, mode, users):
+        m = self.m
+        cid = str(ch.id)
+        sessions = m.blackjack_sessions if mode == "bj" else m.blind_sessions
+        t0 = time.perf_counter()
+        await self.timed("count", m.PlayerCountButton(len(users), mode).callback(FakeInteraction(ch, users[0])))
+        for u in users:
+            await self.timed("join", m.참가.callback(FakeContext(ch, u), str(self.bet)))
+        sess = sessions.get(cid)
+        while sessions.get(cid) is sess and sess is not None:
+            for u in users:
+                uid = str(u.id)
+                if sessions.get(cid) is not sess:
+                    break
+                if mode == "bj" and uid in sess.pending_ace:
+                    action = "ace11" if sess.score(uid) <= 21 else "ace1"
+                elif uid in sess.stayed or uid in sess.busted or sess.actions.get(uid):
+                    continue
+                else:
+                    action = "hit" if sess.score(uid) < self.threshold else "stay"
+                button = m.TableButton(mode, action, action, m.discord.ButtonStyle.secondary)
+                t1 = time.perf_counter()
+                await button.callback(FakeInteraction(ch, u))
+                op = action if sessions.get(cid) is sess else "settle"
+                self.lat.setdefault(op, []).append(time.perf_counter() - t1)
+                self.actions += 1
+        self.lat.setdefault("game", []).append(time.perf_counter() - t0)
+
+    async def table(self, ch, users, games, rng):
+        for _ in range(games):
+            mode = rng.choice(("bj", "blind"))
+            await self.game(ch, mode, users[:rng.randint(2, 4)])
+
+def load_casino(args, db):
+    os.environ.update(STORAGE_BACKEND=args.backend, LEDGER_DB=db, LEDGER_FLUSH_INTERVAL="3600")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as casino
+    return casino
+
+async def run(args, casino, sheet, api):
+    import numpy as np
+    casino.ws = lambda title: sheet
+    casino.shoe_pool.rng = np.random.default_rng(args.seed)
+    store = casino.store
+    storage_calls, journal_writes = Counter(), Counter()
+    run_orig, submit_orig = store.run, casino.journal.submit
+
+    async def counted_run(fn, *a, **kw):
+        storage_calls[fn.__name__] += 1
+        return await run_orig(fn, *a, **kw)
+
+    def counted_submit(fn, *a):
+        journal_writes[fn.__name__] += 1
+        return submit_orig(fn, *a)
+
+    # 시작: 장부 열기 + 시트 한 번 읽기 (측정에서 제외)
+    casino.ledger.open()
+    await store.run(casino.ledger.load, timeout=None)
+    store.ready.set()
+    sheet.calls.clear()
+    store.run, casino.journal.submit = counted_run, counted_submit
+
+    bench = Bench(casino, api, args.threshold, args.bet)
+    rng = random.Random(args.seed)
+    per_table, extra = divmod(args.games, args.tables)
+    tasks = []
+    for t in range(args.tables):
+        users = [FakeMember(1000 + t * 4 + i) for i in range(4)]
+        ch = FakeChannel(500000 + t, FakeGuild(users), api)
+        tasks.append(bench.table(ch, users, per_table + (t < extra), random.Random(rng.random())))
+    t0 = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+    # 발신 큐에 남은 메시지와 시트에 남은 변경(주기적 반영 한 번)을 모두 내보낸 다음 센다
+    while any(box.pending for box in list(casino.outboxes.items.values())):
+        await asyncio.sleep(0.01)
+    await store.flush(timeout=None)
+    store.run, casino.journal.submit = run_orig, submit_orig
+    return bench, storage_calls, journal_writes, elapsed
+
+def invariants(casino, uids, bet):
+    # 정산 결과 검증 — 어긋난 항목 설명 목록 (비어 있으면 통과)
+    casino.journal.submit(lambda: None).result()  # 저널 스레드에 남은 저장/삭제/전적 기록을 먼저 끝냄
+    ledger, bad = casino.ledger, []
+    # 전적 한 줄의 증감은 승리 +베팅, 패배/버스트 -베팅 (모든 판이 같은 베팅)
+    wrong = casino.records.conn.execute("SELECT COUNT(*) FROM history WHERE delta != CASE code WHEN ? THEN ? ELSE ? END",
+                                        (casino.WIN, bet, -bet)).fetchone()[0]
+    if wrong:
+        bad.append(f"결과와 맞지 않는 증감 {wrong}줄 (승리 +{bet} / 패배 -{bet})")
+    deltas = dict(casino.records.conn.execute("SELECT uid, SUM(delta) FROM history GROUP BY uid"))
+    for uid in uids:
+        want = SEED_BALANCE + deltas.get(uid, 0)
+        got = ledger.get(uid, f"p{uid}")
+        if got != want:
+            bad.append(f"잔액 {uid}: {got} (시작 잔액 + 전적 증감 = {want})")
+    if hasattr(ledger, "holds"):
+        held = sum(len(h) for h in ledger.holds.values())
+    else:
+        held = ledger.conn().execute("SELECT COUNT(*) FROM holds").fetchone()[0]
+    if held:
+        bad.append(f"남은 예치금 {held}건")
+    if rows := casino.journal.load():
+        bad.append(f"남은 저널 행 {len(rows)}개")
+    return bad
+
+def params(args):
+    # 횟수에 영향을 주는 실행 조건 (기준값과 같은 조건으로 비교해야 의미가 있음)
+    return {k: getattr(args, k) for k in ("games", "tables", "threshold", "sheet_ms", "discord_ms", "seed")}
+
+def summarize(args, bench, sheet, api, storage_calls, journal_writes, elapsed):
+    games = len(bench.lat.get("game", ())) or 1
+    sheets, discord_n = sum(sheet.calls.values()), sum(api.calls.values())
+    return {
+        "backend": args.backend, "params": params(args), "games": games, "tables": args.tables, "actions": bench.actions,
+        "elapsed_s": round(elapsed, 3), "games_per_s": round(games / elapsed, 1),
+        "sheets_calls_per_game": round(sheets / games, 3),
+        "storage_calls_per_game": round(sum(storage_calls.values()) / games, 3),
+        "journal_writes_per_game": round(sum(journal_writes.values()) / games, 3),
+        "discord_calls_per_game": round(discord_n / games, 3),
+        "discord_calls_per_action": round(discord_n / max(bench.actions + games, 1), 3),
+        "latency_ms": {op: {"n": len(xs), "p50": round(pct(xs, 0.5) * 1000, 2), "p99": round(pct(xs, 0.99) * 1000, 2)}
+                       for op, xs in bench.lat.items()},
+        "sheets_calls": dict(sheet.calls), "storage_calls": dict(storage_calls),
+        "journal_writes": dict(journal_writes), "discord_calls": dict(api.calls),
+    }
+
+def report(r):
+    print(f"== {r['backend']} · {r['games']}판 / 테이블 {r['tables']}개 · {r['elapsed_s']}초 ({r['games_per_s']}판/초) ==")
+    print("동작        횟수      p50(ms)   p99(ms)")
+    for op, d in sorted(r["latency_ms"].items()):
+        print(f"{op:<8} {d['n']:>7}  {d['p50']:>9.2f} {d['p99']:>9.2f}")
+    for k in GATED:
+        print(f"{k:<26} {r[k]}")
+    for k in ("sheets_calls", "storage_calls", "journal_writes", "discord_calls"):
+        print(f"{k:<26} {r[k]}")
+
+def check(r, baseline, tolerance, slack):
+    # 왕복 횟수가 기준보다 tolerance 비율 + slack 넘게 늘면 실패.
+    # 같은 --seed 라도 실행마다 조금씩 다르다: 테이블들이 동시에 돌아 스케줄러 순서에 따라 슈를 꺼내는
+    # 순서(=패), 합쳐지는 참가 알림과 시트 반영 횟수가 달라진다. tolerance/slack 은 그 흔들림을 흡수하는 몫.
+    base = baseline.get(r["backend"])
+    if base is None:
+        print(f"⚠️ {r['backend']} 기준값 없음 — --save-baseline 으로 먼저 저장하세요.")
+        return False
+    if base.get("params") != r["params"]:
+        print(f"⚠️ 기준값과 실행 조건이 다름: 기준 {base.get('params')} / 지금 {r['params']}")
+    failed = [k for k in GATED if r[k] > base[k] * (1 + tolerance) + slack + 1e-9]
+    for k in GATED:
+        mark = "❌" if k in failed else "✅"
+        print(f"{mark} {k}: {r[k]} (기준 {base[k]})")
+    return not failed
+
+def main():
+    ap = argparse.ArgumentParser(description="가짜 디스코드/시트로 게임 전체를 돌려 지연과 왕복 횟수 측정")
+    ap.add_argument("--backend", choices=["sqlite", "sheets"], default="sqlite")
+    ap.add_argument("--games", type=int, default=200)
+    ap.add_argument("--tables", type=int, default=8, help="동시에 진행하는 채널 수")
+    ap.add_argument("--threshold", type=int, default=17)
+    ap.add_argument("--bet", type=int, default=10)
+    ap.add_argument("--sheet-ms", type=float, default=50, help="시트 호출마다 넣을 지연")
+    ap.add_argument("--discord-ms", type=float, default=20, help="디스코드 REST 호출마다 넣을 지연")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="결과를 JSON 파일로 저장")
+    ap.add_argument("--check", action="store_true", help="정산 불변식이 깨지거나 기준값보다 왕복이 늘면 종료 코드 1")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.05)
+    ap.add_argument("--slack", type=float, default=0.05, help="비율과 별도로 허용하는 판당 왕복 수")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="casino-bench-")
+    casino = load_casino(args, os.path.join(tmp, "bench.db"))
+    header = [["ID", "이름", "소지금", "시간"]]
+    uids = [str(1000 + i) for i in range(args.tables * 4)]
+    sheet = FakeWorksheet(header + [[uid, f"p{uid}", SEED_BALANCE, ""] for uid in uids], args.sheet_ms / 1000)
+    api = FakeDiscord(args.discord_ms / 1000)
+    try:
+        out = asyncio.run(run(args, casino, sheet, api))
+        bad = invariants(casino, uids, args.bet)
+    finally:
+        casino.store.close()
+        casino.journal.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    r = summarize(args, out[0], sheet, api, *out[1:])
+    r["invariants"] = bad
+    report(r)
+    for line in bad:
+        print(f"❌ 정산 불변식: {line}")
+    if not bad:
+        print("✅ 정산 불변식: 증감 = ±베팅, 잔액 = 시작 잔액 + 전적 증감, 남은 예치금/저널 행 없음")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(r, f, ensure_ascii=False, indent=2)
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if bad and (args.check or args.save_baseline):
+        sys.exit(1)
+    if args.save_baseline:
+        baseline[args.backend] = {"params": r["params"], **{k: r[k] for k in GATED}}
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 기준값 저장: {BASELINE}")
+    elif args.check and not check(r, baseline, args.tolerance, args.slack):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# 🃏 블랙잭 엔진 (디스코드와 무관 — 봇과 시뮬레이션이 같이 사용)
+# 카드는 0~51 정수: suit*13 + rank (rank 0=A, 1~9=2~10, 10~12=J/Q/K).
+# 점수는 표에서 바로 꺼내 누적하고, 문자열은 화면에 보여줄 때만 만든다.
+import uuid, threading, time
+from collections import deque, OrderedDict
+import numpy as np
+
+suits = ['♠', '♥', '♦', '♣']
+ranks = ['A'] + [str(i) for i in range(2, 11)] + ['J', 'Q', 'K']
+full_deck = list(range(52))
+
+CARD_STR = [f"{s}{r}" for s in suits for r in ranks]
+RANK = [c % 13 for c in full_deck]
+IS_ACE = [r == 0 for r in RANK]
+VALUE_HIGH = [11 if r == 0 else min(r + 1, 10) for r in RANK]  # 블랙잭: A 기본 11
+VALUE_LOW = [1 if r == 0 else min(r + 1, 10) for r in RANK]    # 블라인드: A는 항상 1
+
+def card_str(card):
+    return CARD_STR[card]
+
+def hand_str(cards):
+    return " ".join(CARD_STR[c] for c in cards)
+
+# ─────────────────────────────────────────────
+# 👞 슈: 여러 벌을 미리 섞어 둔 배열 — 딜은 인덱스만 증가
+# ─────────────────────────────────────────────
+class ShoePool:
+    # 섞인 슈를 한 번에 여러 개(size) 만들어 두고 채널마다 꺼내 준다
+    def __init__(self, decks=1, penetration=0.75, size=64, seed=None):
+        self.decks, self.penetration, self.size = decks, penetration, size
+        self.base = np.tile(np.arange(52, dtype=np.uint8), decks)
+        self.rng = np.random.default_rng(seed)
+        self.ready = deque()
+        self.lock = threading.Lock()
+
+    def low(self):
+        return len(self.ready) < self.size // 2
+
+    def refill(self):
+        # 모자란 개수만큼 (n, 52*decks) 배열을 행마다 한꺼번에 섞음
+        with self.lock:
+            need = self.size - len(self.ready)
+            if need <= 0:
+                return 0
+            batch = self.rng.permuted(np.broadcast_to(self.base, (need, len(self.base))).copy(), axis=1)
+            self.ready.extend(batch)
+            return need
+
+    def take(self):
+        with self.lock:
+            if self.ready:
+                return self.ready.popleft()
+            return self.rng.permutation(self.base)
+
+    def shoe(self):
+        return Shoe(self)
+
+class Shoe:
+    __slots__ = ("pool", "cards", "pos", "cut")
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.reload()
+
+    # ── 저장/복원: 남은 배열을 hex 문자열로 (1바이트/장) ──
+    def snapshot(self):
+        return {"cards": bytes(self.cards).hex(), "pos": self.pos}
+
+    @classmethod
+    def restore(cls, pool, d):
+        shoe = cls.__new__(cls)
+        shoe.pool, shoe.pos = pool, d["pos"]
+        shoe.cards = np.frombuffer(bytes.fromhex(d["cards"]), dtype=np.uint8).copy()
+        shoe.cut = int(len(shoe.cards) * pool.penetration)
+        return shoe
+
+    def reload(self):
+        self.cards, self.pos = self.pool.take(), 0
+        self.cut = int(len(self.cards) * self.pool.penetration)  # 컷 카드 위치
+
+    @property
+    def needs_shuffle(self):
+        return self.pos >= self.cut
+
+    def __len__(self):
+        return len(self.cards) - self.pos
+
+    def pop(self):
+        # 판 도중에 다 떨어지면 새 슈로 이어서 딜 (IndexError 없음)
+        if self.pos >= len(self.cards):
+            self.reload()
+        card = int(self.cards[self.pos])
+        self.pos += 1
+        return card
+
+# ─────────────────────────────────────────────
+# 공통 세션: 최고 점수(21 이하) 승리, 전원 버스트면 전원 패배
+# ─────────────────────────────────────────────
+class Session:
+    __slots__ = ("cid", "deck", "max_players", "sid", "players", "actions", "totals", "soft",
+                 "stayed", "busted", "bets", "started", "ended", "view")
+    VALUES = VALUE_HIGH
+
+    def __init__(self, cid, deck, max_players):
+        self.cid, self.deck, self.max_players = cid, deck, max_players
+        self.sid = uuid.uuid4().hex  # 정산 멱등 키
+        self.players, self.actions = {}, {}
+        self.totals, self.soft = {}, {}  # uid: 합계 / 11로 세고 있는 A 개수
+        self.stayed, self.busted, self.bets = set(), set(), {}
+        self.started = False
+        self.ended = False  # 승패가 정해져 정산만 남음 (정산 실패 시 다시 시도)
+        self.view = None  # 테이블 메시지에 붙은 버튼 (봇이 사용)
+
+    def _take(self, uid, card):
+        self.players[uid].append(card)
+        self.totals[uid] += self.VALUES[card]
+        if self.VALUES[card] == 11:
+            self.soft[uid] += 1
+
+    def deal_initial(self, uid):
+        # 항상 2장씩 분배 (이미 등록된 유저라도)
+        self.players[uid], self.totals[uid], self.soft[uid] = [], 0, 0
+        for _ in range(2):
+            self._take(uid, self.deck.pop())
+        self.actions[uid] = False
+        return self.players[uid]
+
+    def score(self, uid):
+        return self.totals[uid]
+
+    def hand(self, uid):
+        return hand_str(self.players[uid])
+
+    def hit(self, uid):
+        card = self.deck.pop()
+        self._take(uid, card)
+        self.actions[uid] = True
+        return card
+
+    def stay(self, uid):
+        self.stayed.add(uid)
+        self.actions[uid] = True
+
+    def everyone_joined(self):
+        return len(self.players) == self.max_players and len(self.bets) == self.max_players
+
+    def everyone_acted(self):
+        return all(self.actions.get(u) or u in self.busted for u in self.players)
+
+    def reset_actions(self):
+        for u in self.players:
+            if u not in self.stayed and u not in self.busted:
+                self.actions[u] = False
+
+    def is_finished(self):
+        return all(u in self.stayed or self.totals[u] > 21 for u in self.players)
+
+    def winners(self):
+        # 21 이하 최고 점수 전원 (동점이면 모두 승리), 전원 버스트면 빈 목록
+        alive = {u: t for u, t in self.totals.items() if t <= 21}
+        if not alive:
+            return []
+        best = max(alive.values())
+        return [u for u, t in alive.items() if t == best]
+
+    def payouts(self):
+        # uid -> 증감: 승자는 +베팅, 나머지는 -베팅
+        win = set(self.winners())
+        return {u: b if u in win else -b for u, b in self.bets.items()}
+
+    # ── 저장/복원 (재시작 후 이어서 진행) ──
+    def snapshot(self):
+        return {"sid": self.sid, "max": self.max_players, "started": self.started, "ended": self.ended,
+                "players": self.players, "actions": self.actions, "totals": self.totals, "soft": self.soft,
+                "stayed": sorted(self.stayed), "busted": sorted(self.busted), "bets": self.bets,
+                "deck": self.deck.snapshot()}
+
+    @classmethod
+    def restore(cls, cid, deck, d):
+        sess = cls(cid, deck, d["max"])
+        sess.sid, sess.started, sess.ended = d["sid"], d["started"], d.get("ended", False)
+        sess.players, sess.actions, sess.bets = d["players"], d["actions"], d["bets"]
+        sess.totals, sess.soft = d["totals"], d["soft"]
+        sess.stayed, sess.busted = set(d["stayed"]), set(d["busted"])
+        return sess
+
+# ─────────────────────────────────────────────
+# 블랙잭: 공개 패, 히트로 받은 A는 1/11 선택
+# ─────────────────────────────────────────────
+class BlackjackSession(Session):
+    __slots__ = ("pending_ace",)
+
+    def __init__(self, cid, deck, max_players):
+        super().__init__(cid, deck, max_players)
+        self.pending_ace = set()  # A값 선택을 기다리는 uid
+
+    def hit(self, uid):
+        card = super().hit(uid)
+        if IS_ACE[card]:
+            self.pending_ace.add(uid)
+        return card
+
+    def choose_ace(self, uid, val):
+        # 방금 받은 A는 11로 더해져 있으므로 1을 고르면 10을 뺀다
+        self.pending_ace.discard(uid)
+        if val == 1 and self.soft[uid]:
+            self.totals[uid] -= 10
+            self.soft[uid] -= 1
+
+    def everyone_acted(self):
+        return not self.pending_ace and super().everyone_acted()
+
+    def snapshot(self):
+        return {**super().snapshot(), "pending_ace": sorted(self.pending_ace)}
+
+    @classmethod
+    def restore(cls, cid, deck, d):
+        sess = super().restore(cid, deck, d)
+        sess.pending_ace = set(d.get("pending_ace", ()))
+        return sess
+
+# ─────────────────────────────────────────────
+# 블라인드 블랙잭: 패 비공개, A는 항상 1
+# ─────────────────────────────────────────────
+class BlindBlackjackSession(Session):
+    __slots__ = ()
+    VALUES = VALUE_LOW
+
+# ─────────────────────────────────────────────
+# 🗂️ 채널별 저장소: 최근 사용 순(LRU) 상한 + 유휴 시간(TTL) 만료
+# ─────────────────────────────────────────────
+class Registry:
+    def __init__(self, max_size=1000, ttl=None, on_evict=None):
+        self.max_size, self.ttl = max_size, ttl
+        self.on_evict = on_evict   # (cid, 값) — 상한 초과로 밀려난 항목 처리
+        self.items = OrderedDict()  # cid -> 값 (오래된 것부터)
+        self.seen = {}              # cid -> 마지막 사용 시각
+        self.evicted = self.expired = 0
+
+    def __contains__(self, cid):
+        return cid in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def touch(self, cid):
+        self.items.move_to_end(cid)
+        self.seen[cid] = time.monotonic()
+
+    def get(self, cid, default=None):
+        if cid not in self.items:
+            return default
+        self.touch(cid)
+        return self.items[cid]
+
+    def __getitem__(self, cid):
+        self.touch(cid)
+        return self.items[cid]
+
+    def __setitem__(self, cid, value):
+        self.items[cid] = value
+        self.touch(cid)
+        while len(self.items) > self.max_size:
+            old, v = self.items.popitem(last=False)
+            self.seen.pop(old, None)
+            self.evicted += 1
+            if self.on_evict:
+                self.on_evict(old, v)
+
+    def pop(self, cid, default=None):
+        self.seen.pop(cid, None)
+        return self.items.pop(cid, default)
+
+    def __delitem__(self, cid):
+        self.seen.pop(cid, None)
+        del self.items[cid]
+
+    def expire(self, now=None):
+        # TTL 동안 쓰이지 않은 항목을 빼서 [(cid, 값)] 으로 돌려줌
+        if self.ttl is None:
+            return []
+        limit = (now or time.monotonic()) - self.ttl
+        out = []
+        for cid in list(self.items):  # 오래된 것부터이므로 처음 만나는 최근 항목에서 멈춤
+            if self.seen[cid] > limit:
+                break
+            out.append((cid, self.pop(cid)))
+        self.expired += len(out)
+        return out
+
+    def stats(self):
+        return {"live": len(self.items), "evicted": self.evicted, "expired": self.expired}
@@ -4,16 +4,44 @@ from discord.ext import commands
 from discord.ui import Button, View
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
-import random, os, json, sys
-from datetime import datetime, timedelta, timezone
+import random, os, json, sys, signal, asyncio, subprocess, time, threading, functools, uuid
+import metrics
+from storage import SheetMirror, BalanceLedger, SQLiteLedger, AsyncStore, GameJournal, LedgerLog, GameRecords, WIN, LOSS, BUST
+from blackjack import BlackjackSession, BlindBlackjackSession, ShoePool, Shoe, Registry, card_str, IS_ACE
+from outbox import Outbox, HIGH, LOW
+import minigames
 
-KST = timezone(timedelta(hours=9))
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
 
 # ─────────────────────────────────────────────
-# 📊 Google Sheets 인증
+# 🧩 샤딩: BOT_PROCESSES 개의 프로세스가 SHARD_COUNT 개의 샤드를 나눠 맡음
+# 길드 이벤트는 항상 그 길드의 샤드로 오므로 채널의 테이블은 한 프로세스가 소유하고,
+# 소지금·예치금·게임 저널은 같은 SQLite 파일(LEDGER_DB)을 공유한다.
+# ─────────────────────────────────────────────
+BOT_PROCESSES = int(os.getenv("BOT_PROCESSES", "1"))
+PROCESS_INDEX = int(os.getenv("BOT_PROCESS_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0: 샤딩 없이 단일 연결
+SHARD_IDS = os.getenv("SHARD_IDS")  # 없으면 전체 샤드, 빈 값은 설정 오류 (맡을 샤드가 없는 프로세스)
+if SHARD_IDS is not None:
+    SHARD_IDS = [int(x) for x in SHARD_IDS.split(",") if x.strip()]
+    if not SHARD_IDS:
+        sys.exit("SHARD_IDS 가 비어 있습니다 — 맡을 샤드를 지정하거나 변수를 지우세요.")
+IS_LEADER = PROCESS_INDEX == 0  # 시트 미러는 한 프로세스만
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+
+def owns_guild(guild_id):
+    if not SHARD_COUNT or SHARD_IDS is None: return True
+    return (int(guild_id) >> 22) % SHARD_COUNT in SHARD_IDS
+
+# ─────────────────────────────────────────────
+# 📊 Google Sheets 인증 (처음 쓸 때 한 번, 스프레드시트/워크시트 핸들은 캐시)
+# 토큰 만료는 gspread의 google-auth 세션이 알아서 갱신하고,
+# 429/5xx는 BackOffHTTPClient가 물러났다가 재시도한다.
 # ─────────────────────────────────────────────
 DISCORD_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 GOOGLE_CREDS = os.getenv("GOOGLE_CREDS")
@@ -24,98 +52,542 @@ scope = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive"
 ]
-creds_dict = json.loads(GOOGLE_CREDS)
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-gclient = gspread.authorize(creds)
+_gclient = None
+_sheets = {}  # None: 스프레드시트, 제목: 워크시트
+_sheets_lock = threading.Lock()
+
+def gclient():
+    global _gclient
+    with _sheets_lock:
+        if _gclient is None:
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(GOOGLE_CREDS), scope)
+            _gclient = gspread.authorize(creds, http_client=gspread.BackOffHTTPClient)
+        return _gclient
+
+SHEET_READS = {"get", "get_all_values", "get_all_records", "col_values", "row_values", "acell", "cell", "batch_get"}
+SHEET_WRITES = {"update", "batch_update", "append_row", "append_rows", "update_cell", "update_acell", "clear", "batch_clear", "delete_rows", "insert_row"}
+
+class MeteredSheet:
+    # 워크시트 API 호출마다 읽기/쓰기 횟수와 시간을 기록 (할당량 확인용)
+    def __init__(self, sheet):
+        self._sheet = sheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._sheet, name)
+        kind = "read" if name in SHEET_READS else "write" if name in SHEET_WRITES else None
+        if kind is None or not callable(attr):
+            return attr
+        def call(*a, **kw):
+            metrics.SHEETS_CALLS.inc(kind=kind, op=name)
+            with metrics.SHEETS_SECONDS.time(kind=kind, op=name):
+                return attr(*a, **kw)
+        return call
 
 def ws(title: str):
-    return gclient.open_by_key(SHEET_KEY).worksheet(title)
-
-# ─────────────────────────────────────────────
-# 🧰 유틸
-# ─────────────────────────────────────────────
-def now_kst_str(fmt="%Y-%m-%d %H:%M:%S"):
-    return datetime.now(KST).strftime(fmt)
-
-def _find_row_by_id(sh, user_id: str):
-    col_a = sh.col_values(1)
-    for idx, v in enumerate(col_a, start=1):
-        if (v or "").strip() == user_id:
-            return idx
-    return None
-
-def ensure_user_row(user_id: str, user_name: str):
-    sh = ws("소지금")
-    row = _find_row_by_id(sh, user_id)
-    if not row:
-        sh.append_row([user_id, user_name, 100, now_kst_str()])
-    return True
-
-def get_balance(user_id: str, user_name: str):
-    sh = ws("소지금")
-    row = _find_row_by_id(sh, user_id)
-    if not row:
-        ensure_user_row(user_id, user_name)
-        return 100
-    return int(sh.cell(row, 3).value or 0)
-
-def set_balance(user_id: str, user_name: str, value: int):
-    sh = ws("소지금")
-    row = _find_row_by_id(sh, user_id)
-    if not row:
-        ensure_user_row(user_id, user_name)
-        row = _find_row_by_id(sh, user_id)
-    value = max(int(value), 0)
-    sh.update_acell(f"C{row}", value)
-    sh.update_acell(f"D{row}", now_kst_str())
-    return value
-
-def add_balance(user_id: str, user_name: str, delta: int):
-    cur = get_balance(user_id, user_name)
-    return set_balance(user_id, user_name, cur + delta)
+    sh = _sheets.get(title)
+    if sh is None:
+        book = _sheets.get(None) or gclient().open_by_key(SHEET_KEY)
+        with _sheets_lock:
+            _sheets[None] = book
+            sh = _sheets[title] = MeteredSheet(book.worksheet(title))
+    return sh
+
+def reset_sheets():
+    # 시트 호출이 실패하면 다음 호출 때 핸들을 다시 연다
+    with _sheets_lock:
+        _sheets.clear()
+
+# ─────────────────────────────────────────────
+# 💾 소지금 (장부 → 주기적으로 "소지금" 시트에 미러)
+# STORAGE_BACKEND=sqlite : 로컬 SQLite(WAL)가 원본 (기본값)
+# STORAGE_BACKEND=sheets : 메모리 장부, 시트가 원본
+# 두 백엔드 모두 가입·잔액 변경을 LEDGER_DB의 ledger_log 에 먼저 기록한다 (감사 기록,
+# 시트 재구성: python main.py rebuild-sheet [--force])
+# ─────────────────────────────────────────────
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+LEDGER_DB = os.getenv("LEDGER_DB", "casino.db")
+# Heroku 다이노는 재시작(하루 한 번 이상)마다 파일 시스템이 초기화된다 — 기본 경로면 저널·장부 로그·전적이
+# 다이노가 바뀔 때마다 사라지므로, 유지되는 저장소 경로를 LEDGER_DB 로 직접 정해야 시작한다
+if os.getenv("DYNO") and not os.getenv("LEDGER_DB"):
+    sys.exit("Heroku 다이노에서는 LEDGER_DB 를 유지되는 저장소 경로로 지정해야 합니다 "
+             "(기본 casino.db 는 다이노 재시작 때 사라져 테이블 복원·전적·장부 로그가 초기화됨).")
+FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "5"))
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "4"))
+STORAGE_TIMEOUT = float(os.getenv("STORAGE_TIMEOUT", "10"))
+mirror = SheetMirror(lambda: ws("소지금"))
+if STORAGE_BACKEND == "sheets":
+    if BOT_PROCESSES > 1 or SHARD_IDS is not None:
+        sys.exit("STORAGE_BACKEND=sheets 는 단일 프로세스에서만 사용할 수 있습니다.")
+    ledger = BalanceLedger(mirror, FLUSH_INTERVAL, LedgerLog(LEDGER_DB))
+else:
+    ledger = SQLiteLedger(LEDGER_DB, mirror if IS_LEADER else None, FLUSH_INTERVAL)
+# 핸들러는 이벤트 루프를 막지 않도록 항상 store를 await 한다
+store = AsyncStore(ledger, STORAGE_WORKERS, STORAGE_TIMEOUT)
+ledger_task = warm_task = None
+
+async def ensure_user_row(user_id: str, user_name: str):
+    return await store.ensure_user_row(user_id, user_name)
+
+async def get_balance(user_id: str, user_name: str):
+    return await store.get_balance(user_id, user_name)
+
+async def set_balance(user_id: str, user_name: str, value: int):
+    return await store.set_balance(user_id, user_name, value)
+
+async def add_balance(user_id: str, user_name: str, delta: int):
+    return await store.add_balance(user_id, user_name, delta)
+
+async def ledger_flusher():
+    while True:
+        await asyncio.sleep(ledger.flush_interval)
+        try:
+            # 시트 쓰기는 간격보다 오래 걸릴 수 있으므로 별도 한도 없이 기다림
+            await store.flush(timeout=None)
+        except Exception as e:
+            reset_sheets()
+            print(f"⚠️ 소지금 시트 반영 실패: {e!r}")
+
+async def warm_up():
+    # 봇이 뜬 뒤 백그라운드에서 시트 인증 + 소지금 표 미리 읽기.
+    # 실패해도 부팅은 멈추지 않고, 간격을 늘려 가며 다시 시도한다.
+    delay = 1
+    while True:
+        try:
+            n = await store.run(ledger.load, timeout=None)
+            restore_voids.extend(await store.run(restore_holds, timeout=None))
+            store.ready.set()
+            print(f"📊 소지금 표 준비 완료 ({n}명)")
+            break
+        except Exception as e:
+            reset_sheets()
+            print(f"⚠️ 소지금 표 준비 실패, {delay}초 후 재시도: {e!r}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 300)
+    while restore_voids:
+        sess, notice = restore_voids.pop()
+        for sessions in (blackjack_sessions, blind_sessions):
+            if sessions.get(sess.cid) is sess: del sessions[sess.cid]
+        try: await void_session(sess, notice)
+        except Exception as e: print(f"⚠️ 복원 테이블 정리 실패 {sess.cid}: {e!r}")
 
 # ─────────────────────────────────────────────
 # ♣ 덱 관리
 # ─────────────────────────────────────────────
-channel_decks = {}
-suits = ['♠', '♥', '♦', '♣']
-ranks = ['A'] + [str(i) for i in range(2, 11)] + ['J', 'Q', 'K']
-full_deck = [f"{s}{r}" for s in suits for r in ranks]
+# SHOE_DECKS 벌을 섞은 슈를 채널·게임마다 하나씩, 컷 카드(SHOE_PENETRATION)를 넘으면 교체
+SHOE_DECKS = int(os.getenv("SHOE_DECKS", "1"))
+SHOE_PENETRATION = float(os.getenv("SHOE_PENETRATION", "0.75"))
+shoe_pool = ShoePool(SHOE_DECKS, SHOE_PENETRATION, size=int(os.getenv("SHOE_POOL", "64")))
+shoe_task = None
+# 채널 덱은 최근 사용한 DECK_MAX 개만, DECK_TTL 초 동안 안 쓰면 정리 (필요하면 다시 생성)
+channel_decks = Registry(int(os.getenv("DECK_MAX", "2000")), float(os.getenv("DECK_TTL", "21600")))
 
 def shuffle_decks(cid):
-    channel_decks[cid] = {
-        "blackjack": random.sample(full_deck, len(full_deck)),
-        "blind": random.sample(full_deck, len(full_deck))
-    }
+    decks = channel_decks.get(cid)
+    if decks is None:
+        channel_decks[cid] = {"blackjack": shoe_pool.shoe(), "blind": shoe_pool.shoe()}
+        return
+    for shoe in decks.values():
+        if shoe.needs_shuffle: shoe.reload()
 
 def ensure_channel(cid):
     if cid not in channel_decks:
         shuffle_decks(cid)
 
+async def shoe_refiller():
+    # 미리 섞어 둔 슈가 절반 아래로 줄면 백그라운드 스레드에서 한 번에 보충
+    while True:
+        if shoe_pool.low():
+            await asyncio.to_thread(shoe_pool.refill)
+        await asyncio.sleep(1)
+
 # ─────────────────────────────────────────────
 # 세션 저장
 # ─────────────────────────────────────────────
-blackjack_sessions = {}
-blind_sessions = {}
+# 채널당 한 판. SESSION_TTL 초 동안 아무 조작이 없거나 SESSION_MAX 개를 넘으면
+# 오래된 판부터 무효 처리하고 묶인 베팅을 돌려준다.
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+REAP_INTERVAL = float(os.getenv("REAP_INTERVAL", "60"))
+reaper_task = None
+
+EVICT_NOTICE = "⚠️ 동시 진행 테이블이 너무 많아 이 게임이 취소되었습니다."
+restore_voids = []  # 시작 시 복원하다 밀려났거나 베팅을 다시 묶지 못한 판 — 장부 준비 뒤 무효 처리
+
+def _evicted(cid, sess):
+    try: loop = asyncio.get_running_loop()
+    except RuntimeError:  # 복원 중 (이벤트 루프 시작 전)
+        restore_voids.append((sess, EVICT_NOTICE)); return
+    loop.create_task(void_session(sess, EVICT_NOTICE))
+
+blackjack_sessions = Registry(SESSION_MAX, SESSION_TTL, _evicted)
+blind_sessions = Registry(SESSION_MAX, SESSION_TTL, _evicted)
+
+# 진행 중인 테이블은 변경될 때마다 저널(LEDGER_DB의 games 테이블)에 기록 → 재시작 시 복원
+journal = GameJournal(LEDGER_DB)
+# 끝난 판의 결과는 전적(history/stats 테이블)에 — 쓰기는 저널과 같은 단일 스레드로
+records = GameRecords(LEDGER_DB)
+
+def save_session(mode, sess, guild):
+    gid = guild.id if guild else 0
+    journal.submit(journal.save, sess.cid, mode, sess.sid, gid, json.dumps(sess.snapshot(), separators=(",", ":")))
+
+def drop_session(sess):
+    journal.submit(journal.drop, sess.cid, sess.sid)
+
+def restore_sessions():
+    # 저널에 남은 (이 프로세스 샤드의) 테이블을 다시 올림 — 로컬 파일만 읽으므로 즉시 끝남
+    restored = 0
+    for cid, mode, sid, guild, state in journal.load():
+        if not owns_guild(guild): continue  # 다른 샤드 프로세스의 테이블
+        d = json.loads(state)
+        shoe = Shoe.restore(shoe_pool, d["deck"])
+        ensure_channel(cid)
+        channel_decks[cid]["blackjack" if mode=="bj" else "blind"] = shoe
+        cls, sessions = (BlackjackSession, blackjack_sessions) if mode=="bj" else (BlindBlackjackSession, blind_sessions)
+        sessions[cid] = cls.restore(cid, shoe, d)
+        restored += 1
+    return restored
+
+def restore_holds():
+    # 장부가 준비된 뒤: 저널에 없는 판의 예치금은 풀고 (다른 프로세스의 판은 유지),
+    # 복원한 판의 베팅은 다시 묶는다. 묶지 못한 판(그사이 소지금이 줄어듦)은 돌려줘서 무효 처리
+    ledger.prune_holds({sid for _, _, sid, _, _ in journal.load()})
+    short = []
+    for sessions in (blackjack_sessions, blind_sessions):
+        for sess in list(sessions.items.values()):
+            if not all(ledger.reserve(sess.sid, uid, f"UID:{uid}", bet) for uid, bet in sess.bets.items()):
+                print(f"⚠️ 복원한 테이블 {sess.cid}: 베팅을 다시 묶지 못해 취소")
+                short.append((sess, "⚠️ 재시작 후 베팅을 다시 묶지 못해 (소지금 부족) 게임이 취소되었습니다. 베팅은 반환됩니다."))
+    return short
+
+async def void_session(sess, notice):
+    # 정산 없이 판을 닫음: 예치금 해제(=베팅 반환) + 버튼 정리 + 안내
+    drop_session(sess)
+    await store.release(sess.sid)
+    if sess.view: sess.view.stop()
+    ch = bot.get_channel(int(sess.cid))
+    if ch: post(ch, notice, HIGH)
+
+async def session_reaper():
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        channel_decks.expire()
+        stale = blackjack_sessions.expire() + blind_sessions.expire()
+        for cid, sess in stale:
+            try: await void_session(sess, "⌛ 오래 진행되지 않아 게임이 취소되었습니다. 베팅은 반환됩니다.")
+            except Exception as e: print(f"⚠️ 세션 정리 실패 {cid}: {e!r}")
+        if stale:
+            print(f"🧹 유휴 세션 {len(stale)}개 정리 — 블랙잭 {blackjack_sessions.stats()} / 블라인드 {blind_sessions.stats()}")
+
+# ─────────────────────────────────────────────
+# 📈 메트릭: METRICS_PORT(없으면 PORT)에서 /metrics 제공, 0이면 끔
+# 샤드 프로세스는 각자 METRICS_PORT + 프로세스 번호에서 연다.
+# ─────────────────────────────────────────────
+METRICS_PORT = int(os.getenv("METRICS_PORT") or os.getenv("PORT") or "0")
+LAG_INTERVAL = float(os.getenv("LAG_INTERVAL", "1"))
+lag_task = None
+
+COMMAND_SECONDS = metrics.Histogram("casino_command_seconds", "명령 처리 시간", ("command", "outcome"))
+BUTTON_SECONDS = metrics.Histogram("casino_button_seconds", "버튼 콜백 처리 시간", ("button", "outcome"))
+DISCORD_CALLS = metrics.Counter("casino_discord_requests_total", "디스코드 REST 호출 수 (상호작용 응답 포함)", ("method", "route"))
+DISCORD_SECONDS = metrics.Histogram("casino_discord_request_seconds", "디스코드 REST 호출 시간", ("method", "route", "outcome"))
+LOOP_LAG = metrics.Histogram("casino_event_loop_lag_seconds", "이벤트 루프 지연",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+LOOP_LAG_LAST = metrics.Gauge("casino_event_loop_lag_last_seconds", "마지막으로 잰 이벤트 루프 지연")
+
+def _registry_stats():
+    out = {}
+    for kind, reg in (("bj", blackjack_sessions), ("blind", blind_sessions), ("deck", channel_decks), ("outbox", outboxes)):
+        for state, v in reg.stats().items():
+            out[(kind, state)] = v
+    return out
+
+metrics.Gauge("casino_registry_items", "채널별 저장소 항목 (live: 현재 개수, evicted/expired: 누적 정리 수)",
+              ("registry", "state"), fn=_registry_stats)
+metrics.Gauge("casino_storage_ready", "소지금 장부 준비 여부", fn=lambda: int(store.ready.is_set()))
+metrics.Gauge("casino_gateway_latency_seconds", "게이트웨이 하트비트 지연",
+              fn=lambda: bot.latency if bot.latency == bot.latency and bot.latency != float("inf") else 0)
+
+def _meter_rest(cls):
+    # 봇 REST(HTTPClient)와 상호작용 응답/팔로업(웹후크 어댑터)이 모두 거치는 request를 감쌈
+    orig = cls.request
+    @functools.wraps(orig)
+    async def request(self, route, *a, **kw):
+        DISCORD_CALLS.inc(method=route.method, route=route.path)
+        with DISCORD_SECONDS.time(method=route.method, route=route.path):
+            return await orig(self, route, *a, **kw)
+    cls.request = request
+
+_meter_rest(discord.http.HTTPClient)
+_meter_rest(discord.webhook.async_.AsyncWebhookAdapter)
+
+def metered(fn):
+    # 버튼 콜백 시간 (custom_id 별, 상태를 담은 custom_id 는 metric_id 로 묶음)
+    @functools.wraps(fn)
+    async def callback(self, inter):
+        with BUTTON_SECONDS.time(button=getattr(self, "metric_id", self.custom_id)):
+            return await fn(self, inter)
+    return callback
+
+@bot.before_invoke
+async def _command_started(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def _command_finished(ctx):
+    # after_invoke 는 명령이 실패해도 불림
+    if hasattr(ctx, "started_at"):
+        COMMAND_SECONDS.observe(time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name,
+                                outcome="error" if ctx.command_failed else "ok")
+
+async def loop_lag_monitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag = max(loop.time() - t0 - LAG_INTERVAL, 0.0)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+# ─────────────────────────────────────────────
+# 📮 발신: 채널 메시지는 채널별 큐(outbox.py)로, 버튼 응답은 3초 안에 반드시
+# ─────────────────────────────────────────────
+SEND_RATE = float(os.getenv("SEND_RATE", "1"))        # 채널당 초당 메시지 (디스코드 한도 5개/5초)
+SEND_BURST = int(os.getenv("SEND_BURST", "5"))
+ACK_DEADLINE = float(os.getenv("ACK_DEADLINE", "2"))  # 이때까지 응답이 없으면 먼저 defer (한도 3초)
+outboxes = Registry(int(os.getenv("OUTBOX_MAX", "2000")))
+_ack_locks = {}  # 상호작용 id -> Lock (워치독과 핸들러 중 한쪽만 첫 응답)
+
+OUTBOX_MESSAGES = metrics.Counter("casino_outbox_messages_total", "발신 큐 메시지 (merged: 합쳐져 줄어든 수)", ("result",))
+ACKS = metrics.Counter("casino_interaction_acks_total", "상호작용 첫 응답 방식", ("kind",))
+metrics.Gauge("casino_outbox_pending", "발신 대기 중인 채널 메시지",
+              fn=lambda: sum(b.pending for b in list(outboxes.items.values())))
+
+def _outbox_sent(n):
+    OUTBOX_MESSAGES.inc(result="sent")
+    if n > 1: OUTBOX_MESSAGES.inc(n - 1, result="merged")
+
+def _outbox_error(e):
+    OUTBOX_MESSAGES.inc(result="error")
+    print(f"⚠️ 메시지 전송 실패: {e!r}")
+
+def post(channel, content=None, priority=LOW, **kw):
+    # 큐에 넣고 바로 돌아감 — 보낸 메시지가 필요하면 돌려받은 future를 await
+    box = outboxes.get(channel.id)
+    if box is None:
+        outboxes[channel.id] = box = Outbox(lambda kw, ch=channel: ch.send(**kw), SEND_RATE, SEND_BURST,
+                                            _outbox_error, _outbox_sent)
+    if content is not None: kw["content"] = content
+    return box.put(priority, **kw)
+
+def ack_lock(inter):
+    lock = _ack_locks.get(inter.id)
+    if lock is None: lock = _ack_locks[inter.id] = asyncio.Lock()
+    return lock
+
+async def _defer(inter, kind):
+    async with ack_lock(inter):
+        if not inter.response.is_done():
+            await inter.response.defer()
+            ACKS.inc(kind=kind)
+
+def acked(fn):
+    # ACK_DEADLINE 까지 응답이 없으면 워치독이 먼저 defer — 이후 응답은 reply/show_table 이
+    # 팔로업/원본 수정으로 보낸다. 핸들러가 응답 없이 끝나거나 실패해도 defer 해서 "상호작용 실패"를 막음
+    @functools.wraps(fn)
+    async def callback(self, inter):
+        async def watchdog():
+            await asyncio.sleep(ACK_DEADLINE)
+            await asyncio.shield(_defer(inter, "deadline"))
+        dog = asyncio.create_task(watchdog())
+        try:
+            return await fn(self, inter)
+        finally:
+            dog.cancel()
+            try: await _defer(inter, "fallback")
+            except discord.HTTPException: pass
+            _ack_locks.pop(inter.id, None)
+    return callback
+
+async def reply(inter, content=None, **kw):
+    async with ack_lock(inter):
+        if inter.response.is_done(): await inter.followup.send(content, **kw)
+        else:
+            await inter.response.send_message(content, **kw)
+            ACKS.inc(kind="response")
 
 # ─────────────────────────────────────────────
 # 명령
 # ─────────────────────────────────────────────
 @bot.event
 async def on_ready():
+    global ledger_task, shoe_task, reaper_task, warm_task, lag_task
+    # custom_id 고정 뷰 — 재시작 전에 보낸 메시지의 버튼도 다시 동작
     bot.add_view(GameMenu())
+    for mode in ("bj", "blind"):
+        bot.add_view(PlayerCountSelectView(mode))
+        bot.add_view(TableView(mode, ace_pending=True))
+    bot.add_dynamic_items(HistoryButton)
+    if warm_task is None:
+        warm_task = asyncio.create_task(warm_up())
+    if ledger_task is None:
+        ledger_task = asyncio.create_task(ledger_flusher())
+    if shoe_task is None:
+        shoe_task = asyncio.create_task(shoe_refiller())
+    if reaper_task is None:
+        reaper_task = asyncio.create_task(session_reaper())
+    if lag_task is None:
+        lag_task = asyncio.create_task(loop_lag_monitor())
     print(f"✅ Logged in as {bot.user}")
 
 @bot.command()
 async def 세팅(ctx):
     ensure_channel(str(ctx.channel.id))
-    await ctx.send("게임을 선택하세요.", view=GameMenu())
+    post(ctx.channel, "게임을 선택하세요.", HIGH, view=GameMenu())
 
 @bot.command()
 async def 유저(ctx):
     uid, uname = str(ctx.author.id), ctx.author.display_name
-    ensure_user_row(uid, uname)
-    await ctx.send(f"✅ {uname} 등록 완료 (소지금: {get_balance(uid, uname)})")
+    await ensure_user_row(uid, uname)
+    post(ctx.channel, f"✅ {uname} 등록 완료 (소지금: {await get_balance(uid, uname)})", HIGH)
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(getattr(error, "original", error), asyncio.TimeoutError):
+        post(ctx.channel, "⚠️ 저장소 응답 지연. 잠시 후 다시 시도하세요.", HIGH)
+        return
+    raise error
+
+# ─────────────────────────────────────────────
+# 🏆 랭킹 / 전적 (시트를 다시 읽지 않음 — 장부의 소지금 색인과 전적 테이블)
+# 랭킹 쪽/순위는 앞 순위 수에 비례 (storage.py 순위 주석), 전적은 seq 커서라 쪽과 무관
+# ─────────────────────────────────────────────
+RANK_PAGE = 10
+HISTORY_PAGE = 10
+MODE_NAMES = {"bj": "블랙잭", "blind": "블라인드"}
+CODE_MARKS = {WIN: "🏆 승", LOSS: "❌ 패", BUST: "💥 버스트"}
+
+@bot.command()
+async def 랭킹(ctx, 쪽:int=1):
+    쪽 = max(쪽, 1)
+    rows = await store.top(RANK_PAGE, (쪽 - 1) * RANK_PAGE)
+    me = await store.rank(str(ctx.author.id))
+    lines = [f"**{(쪽 - 1) * RANK_PAGE + i}.** {name} — {bal:,}" for i, (uid, name, bal) in enumerate(rows, 1)]
+    e = discord.Embed(title=f"🏆 소지금 랭킹 ({쪽}쪽)", description="\n".join(lines) or "표시할 순위가 없습니다.",
+                      color=discord.Color.gold())
+    if me: e.set_footer(text=f"{ctx.author.display_name}: {me[0]}위 / {me[1]}명")
+    post(ctx.channel, embed=e, priority=HIGH)
+
+def history_embed(name, st, rows):
+    e = discord.Embed(title=f"📜 {name} 전적", color=discord.Color.blurple())
+    if st:
+        games, wins, losses, busts, net = st
+        e.description = f"{games}판 {wins}승 {losses}패 (버스트 {busts}) · 승률 {wins / games:.1%} · 누적 {net:+,}"
+    else:
+        e.description = "기록이 없습니다."
+    e.add_field(name="최근 게임", inline=False, value="\n".join(
+        f"<t:{at}:R> {MODE_NAMES.get(mode, mode)} {CODE_MARKS[code]} (합계 {score}) {delta:+,}"
+        for _, at, mode, code, score, delta in rows) or "—")
+    return e
+
+async def history_page(uid, before=None, after=None):
+    # 한 쪽 (최신순) + 더 새/오래된 기록이 있는지 — 진행 방향만 한 줄 더 읽어 확인하고,
+    # 반대 방향은 방금 떠나온 쪽이 있으므로 있다고 본다
+    rows = await store.run(records.history, uid, before, HISTORY_PAGE + 1, after)
+    more = len(rows) > HISTORY_PAGE
+    if after is None:
+        return rows[:HISTORY_PAGE], before is not None, more
+    return rows[-HISTORY_PAGE:], more, True
+
+def history_view(uid, rows, newer, older):
+    # 상태를 custom_id 에 담은 버튼 (uid + 방향 + 기준 seq) — 뷰 시간 제한이 없고 재시작 뒤에도 동작
+    v = View(timeout=None)
+    v.add_item(HistoryButton(uid, "a", rows[0][0] if rows else 0, disabled=not (rows and newer)))
+    v.add_item(HistoryButton(uid, "b", rows[-1][0] if rows else 0, disabled=not (rows and older)))
+    return v
+
+class HistoryButton(discord.ui.DynamicItem[Button], template=r"hist:(?P<uid>\d+):(?P<dir>[ab]):(?P<seq>\d+)"):
+    # a: seq 보다 새 기록 (◀ 이전 쪽), b: seq 보다 오래된 기록 (다음 쪽 ▶)
+    metric_id = "hist"
+
+    def __init__(self, uid, direction, seq, disabled=False):
+        super().__init__(Button(label="◀ 이전" if direction == "a" else "다음 ▶", style=discord.ButtonStyle.secondary,
+                                custom_id=f"hist:{uid}:{direction}:{seq}", disabled=disabled))
+        self.uid, self.direction, self.seq = uid, direction, seq
+
+    @classmethod
+    async def from_custom_id(cls, inter, item, match):
+        return cls(match["uid"], match["dir"], int(match["seq"]))
+
+    @metered
+    @acked
+    async def callback(self, inter):
+        if self.direction == "a": rows, newer, older = await history_page(self.uid, after=self.seq)
+        else: rows, newer, older = await history_page(self.uid, before=self.seq)
+        st = await store.run(records.stats, self.uid)
+        await show_table(inter, embed=history_embed(member_name(inter.guild, self.uid), st, rows),
+                         view=history_view(self.uid, rows, newer, older))
+
+@bot.command()
+async def 전적(ctx, 유저:discord.Member=None):
+    m = 유저 or ctx.author
+    uid = str(m.id)
+    st = await store.run(records.stats, uid)
+    rows, newer, older = await history_page(uid)
+    post(ctx.channel, embed=history_embed(m.display_name, st, rows), view=history_view(uid, rows, newer, older),
+         priority=HIGH)
+
+# ─────────────────────────────────────────────
+# 🎰 미니게임 일괄 플레이: !슬롯 100회 10 / !홀짝 50회 10 짝 / !가위바위보 20회 5 보 / !야바위 / !다이스
+# 결과는 한 번에 뽑고 (minigames.py), 총 증감은 정산 한 번, 요약은 메시지 하나
+# ─────────────────────────────────────────────
+BULK_MAX = int(os.getenv("BULK_MAX", "1000"))
+BULK_PLAYS = metrics.Counter("casino_bulk_plays_total", "일괄 플레이한 판 수", ("game",))
+
+async def bulk_play(ctx, key, 횟수, 금액, 선택=None):
+    g = minigames.GAMES[key]
+    usage = f"!{ctx.command.name} 횟수 금액" + (f" [{'/'.join(g.picks)}]" if g.picks else "") + f" (최대 {BULK_MAX}회)"
+    n = (횟수 or "").removesuffix("회")
+    if not n.isdigit() or not (금액 or "").isdigit() or not 1 <= int(n) <= BULK_MAX or int(금액) < 1:
+        post(ctx.channel, usage, HIGH); return
+    if 선택 is not None and 선택 not in g.picks:
+        post(ctx.channel, usage, HIGH); return
+    n, bet, pick = int(n), int(금액), 선택 or g.default
+    uid, uname = str(ctx.author.id), ctx.author.display_name
+    # 최대 손실(전부 짐)만큼 쓸 수 있어야 시작 — 확인과 정산 사이에 같은 유저의 다른 작업이 끼지 않게
+    async with store.user_lock(uid):
+        if await store.available(uid, uname) < n * bet:
+            post(ctx.channel, f"❌ 소지금 부족. (필요: {n * bet:,})", HIGH); return
+        counts, net = minigames.play(key, n, bet, pick)
+        bal = (await store.settle(f"{key}:{uuid.uuid4().hex}", [(uid, uname, net)]))[uid]
+    BULK_PLAYS.inc(n, game=key)
+    e = discord.Embed(title=f"{g.title} {n}회 × {bet:,}" + (f" — {pick}" if g.picks else ""),
+                      color=discord.Color.green() if net > 0 else discord.Color.dark_grey())
+    e.description = "\n".join(f"{label}: {c}회 ({p:+d}배)" for (label, c), p in zip(counts.items(), g.payouts.tolist()))
+    e.add_field(name="증감", value=f"{net:+,}")
+    e.add_field(name="소지금", value=f"{bal:,}")
+    e.set_footer(text=uname)
+    post(ctx.channel, embed=e, priority=HIGH)
+
+@bot.command()
+async def 슬롯(ctx, 횟수:str=None, 금액:str=None):
+    await bulk_play(ctx, "slot", 횟수, 금액)
+
+@bot.command()
+async def 홀짝(ctx, 횟수:str=None, 금액:str=None, 선택:str=None):
+    await bulk_play(ctx, "odd", 횟수, 금액, 선택)
+
+@bot.command()
+async def 가위바위보(ctx, 횟수:str=None, 금액:str=None, 선택:str=None):
+    await bulk_play(ctx, "rps", 횟수, 금액, 선택)
+
+@bot.command()
+async def 야바위(ctx, 횟수:str=None, 금액:str=None, 선택:str=None):
+    await bulk_play(ctx, "shell", 횟수, 금액, 선택)
+
+@bot.command()
+async def 다이스(ctx, 횟수:str=None, 금액:str=None, 선택:str=None):
+    await bulk_play(ctx, "dice", 횟수, 금액, 선택)
 
 # ─────────────────────────────────────────────
 # 🎮 메인 메뉴
@@ -136,42 +608,44 @@ class MenuButton(Button):
     def __init__(self, label, custom_id, style, row):
         super().__init__(label=label, custom_id=custom_id, style=style, row=row)
 
+    @metered
+    @acked
     async def callback(self, inter):
         cid = str(inter.channel.id)
         ensure_channel(cid)
 
         if self.custom_id == "user":
             uid, uname = str(inter.user.id), inter.user.display_name
-            ensure_user_row(uid, uname)
-            await inter.response.send_message(f"✅ {uname} 등록됨.")
+            await ensure_user_row(uid, uname)
+            await reply(inter, f"✅ {uname} 등록됨.")
             return
 
         if self.custom_id == "bj":
             if cid in blackjack_sessions or cid in blind_sessions:
-                await inter.response.send_message("⚠️ 이미 게임이 진행 중입니다.", ephemeral=True)
+                await reply(inter, "⚠️ 이미 게임이 진행 중입니다.", ephemeral=True)
                 return
-            await inter.response.send_message("🃏 블랙잭 인원 선택", view=PlayerCountSelectView("bj"))
+            await reply(inter, "🃏 블랙잭 인원 선택", view=PlayerCountSelectView("bj"))
             return
 
         if self.custom_id == "blind":
             if cid in blackjack_sessions or cid in blind_sessions:
-                await inter.response.send_message("⚠️ 이미 게임이 진행 중입니다.", ephemeral=True)
+                await reply(inter, "⚠️ 이미 게임이 진행 중입니다.", ephemeral=True)
                 return
-            await inter.response.send_message("🃏 블라인드 블랙잭 인원 선택", view=PlayerCountSelectView("blind"))
+            await reply(inter, "🃏 블라인드 블랙잭 인원 선택", view=PlayerCountSelectView("blind"))
             return
 
         if self.custom_id == "rps":
-            await inter.response.send_message(f"✂️ 결과: {random.choice(['가위','바위','보'])}")
+            await reply(inter, f"✂️ 결과: {random.choice(['가위','바위','보'])}")
         elif self.custom_id == "odd":
-            await inter.response.send_message(f"⚪ 결과: {'홀' if random.randint(1,6)%2 else '짝'}")
+            await reply(inter, f"⚪ 결과: {'홀' if random.randint(1,6)%2 else '짝'}")
         elif self.custom_id == "shell":
-            await inter.response.send_message(f"🎲 야바위: {random.choice(['OXX','XOX','XXO'])}")
+            await reply(inter, f"🎲 야바위: {random.choice(['OXX','XOX','XXO'])}")
         elif self.custom_id == "slot":
-            s = [random.choice(['❤️','💔','💖','💝','🔴','🔥','🦋','💥']) for _ in range(3)]
+            s = [random.choice(minigames.SLOT_SYMBOLS) for _ in range(3)]
             msg = "💥 잭팟!" if len(set(s))==1 else "💎 더블!" if len(set(s))==2 else "❌ 꽝!"
-            await inter.response.send_message(" ".join(s)+"\n"+msg)
+            await reply(inter, " ".join(s)+"\n"+msg)
         elif self.custom_id == "dice":
-            await inter.response.send_message(f"{inter.user.mention} 🎲 {random.randint(1,6)}")
+            await reply(inter, f"{inter.user.mention} 🎲 {random.randint(1,6)}")
 
 # ─────────────────────────────────────────────
 # 인원 선택
@@ -185,117 +659,25 @@ class PlayerCountSelectView(View):
 
 class PlayerCountButton(Button):
     def __init__(self, count, mode):
-        super().__init__(label=f"{count}명", style=discord.ButtonStyle.primary)
+        super().__init__(label=f"{count}명", style=discord.ButtonStyle.primary, custom_id=f"count:{mode}:{count}")
         self.count, self.mode = count, mode
 
+    @metered
+    @acked
     async def callback(self, inter):
         cid = str(inter.channel.id)
+        if cid in blackjack_sessions or cid in blind_sessions:
+            await reply(inter, "⚠️ 이미 게임이 진행 중입니다.", ephemeral=True)
+            return
+        ensure_channel(cid)
         deck = channel_decks[cid]["blackjack" if self.mode=="bj" else "blind"]
         if self.mode=="bj":
-            blackjack_sessions[cid] = BlackjackSession(cid, deck, self.count)
-            await inter.response.send_message(f"🃏 블랙잭({self.count}명) 세션 생성! `!참가 금액`으로 참가하세요.")
+            blackjack_sessions[cid] = sess = BlackjackSession(cid, deck, self.count)
+            await reply(inter, f"🃏 블랙잭({self.count}명) 세션 생성! `!참가 금액`으로 참가하세요.")
         else:
-            blind_sessions[cid] = BlindBlackjackSession(cid, deck, self.count)
-            await inter.response.send_message(f"🃏 블라인드 블랙잭({self.count}명) 세션 생성! `!참가 금액`으로 참가하세요.")
-
-# ─────────────────────────────────────────────
-# 블랙잭 세션
-# ─────────────────────────────────────────────
-class BlackjackSession:
-    def __init__(self, cid, deck, max_players):
-        self.cid, self.deck, self.max_players = cid, deck, max_players
-        self.players, self.ace_values, self.actions = {}, {}, {}
-        self.stayed, self.busted, self.bets = set(), set(), {}
-        self.started = False
-
-    def deal_initial(self, uid):
-        # 항상 2장씩 분배 (이미 등록된 유저라도)
-        cards = [self.deck.pop(), self.deck.pop()]
-        self.players[uid] = cards
-        self.ace_values[uid] = {}
-        self.actions[uid] = False
-        return cards
-
-    def score(self, uid):
-        total = 0
-        for i,c in enumerate(self.players[uid]):
-            r=c[1:]
-            if r in ["J","Q","K"]: total+=10
-            elif r=="A": total+=self.ace_values.get(uid,{}).get(i,11)
-            else: total+=int(r)
-        return total
-
-    def hit(self, uid):
-        card=self.deck.pop(); self.players[uid].append(card); self.actions[uid]=True; return card
-    def stay(self, uid): self.stayed.add(uid); self.actions[uid]=True
-    def everyone_joined(self): return len(self.players)==self.max_players and len(self.bets)==self.max_players
-    def everyone_acted(self): return all(self.actions.get(u) or u in self.busted for u in self.players)
-    def reset_actions(self): [self.actions.update({u:False}) for u in self.players if u not in self.stayed|self.busted]
-    def is_finished(self): return all(u in self.stayed or self.score(u)>21 for u in self.players)
-
-# ─────────────────────────────────────────────
-# 블라인드 블랙잭 세션
-# ─────────────────────────────────────────────
-
-class BlindBlackjackSession:
-    def __init__(self, cid, deck, max_players):
-        self.cid, self.deck, self.max_players = cid, deck, max_players
-        self.players, self.actions = {}, {}
-        self.stayed, self.busted, self.bets = set(), set(), {}
-        self.started = False
-        self.hidden_info = {}  # uid: {"cards": [...], "score": int}
-
-    def deal_initial(self, uid):
-        cards = [self.deck.pop(), self.deck.pop()]
-        self.players[uid] = cards
-        self.hidden_info[uid] = {
-            "cards": cards,
-            "score": self.score_from_cards(cards)
-        }
-        self.actions[uid] = False
-        return cards
-
-    def score_from_cards(self, cards):
-        total = 0
-        for c in cards:
-            r = c[1:]
-            if r in ["J", "Q", "K"]:
-                total += 10
-            elif r == "A":
-                total += 1
-            else:
-                total += int(r)
-        return total
-
-    def score(self, uid):
-        return self.hidden_info[uid]["score"]
-
-    def hit(self, uid):
-        c = self.deck.pop()
-        self.players[uid].append(c)
-        self.actions[uid] = True
-        self.hidden_info[uid]["cards"].append(c)
-        self.hidden_info[uid]["score"] = self.score_from_cards(self.hidden_info[uid]["cards"])
-        return c
-
-    def stay(self, uid):
-        self.stayed.add(uid)
-        self.actions[uid] = True
-
-    def everyone_joined(self):
-        return len(self.players) == self.max_players and len(self.bets) == self.max_players
-
-    def everyone_acted(self):
-        return all(self.actions.get(u) or u in self.busted for u in self.players)
-
-    def reset_actions(self):
-        for u in self.players:
-            if u not in self.stayed and u not in self.busted:
-                self.actions[u] = False
-
-    def is_finished(self):
-        return all(u in self.stayed or self.score(u) > 21 for u in self.players)
-
+            blind_sessions[cid] = sess = BlindBlackjackSession(cid, deck, self.count)
+            await reply(inter, f"🃏 블라인드 블랙잭({self.count}명) 세션 생성! `!참가 금액`으로 참가하세요.")
+        save_session(self.mode, sess, inter.guild)
 
 # ─────────────────────────────────────────────
 # 참가 명령
@@ -307,214 +689,248 @@ async def 참가(ctx, 금액:str=None):
     if cid in blackjack_sessions: sess=blackjack_sessions[cid]; mode="bj"
     elif cid in blind_sessions: sess=blind_sessions[cid]; mode="blind"
     else:
-        await ctx.send("❌ 세션이 없습니다."); return
-    if sess.started: await ctx.send("⚠️ 이미 시작됨."); return
-    if not 금액 or not 금액.isdigit(): await ctx.send("!참가 금액 (숫자)"); return
+        post(ctx.channel,"❌ 세션이 없습니다.",HIGH); return
+    if sess.started: post(ctx.channel,"⚠️ 이미 시작됨.",HIGH); return
+    if not 금액 or not 금액.isdigit(): post(ctx.channel,"!참가 금액 (숫자)",HIGH); return
     bet=int(금액)
-    if bet>get_balance(uid,uname): await ctx.send("❌ 소지금 부족."); return
-    sess.bets[uid]=bet
-    if uid not in sess.players:
-        sess.players[uid] = []  # 플레이어 등록
-    await ctx.send(f"✅ {uname} 참가 — 베팅 {bet}")
-
-    if sess.everyone_joined():
-        sess.started = True
-        await ctx.send(f"✅ 참가자({sess.max_players}명) 전원 참가 완료!\n🃏 첫 카드 분배를 시작합니다...")
-
-        # 🎴 카드 분배 (모두에게 2장씩)
-        for u in sess.bets:
-            sess.deal_initial(u)
-    
-        # 블랙잭 모드 - 카드 공개
-        if mode == "bj":
-            for u in sess.players:
-                member = ctx.guild.get_member(int(u))
-                name = member.display_name if member else f"UID:{u}"
-                cards = " ".join(sess.players[u])
-                score = sess.score(u)
-                await ctx.send(f"**{name}** 님의 첫 패: {cards} (합계 {score})")
-    
-        # 블라인드 블랙잭 모드 - 완전 비공개
-        else:
-            for u in sess.players:
-                member = ctx.guild.get_member(int(u))
-                name = member.display_name if member else f"UID:{u}"
-                await ctx.send(f"**{name}** 님의 첫 패 분배 완료. (카드 및 합계 비공개)")
-    
-        # 🎮 참가자 안내
-        names = [ctx.guild.get_member(int(u)).display_name for u in sess.bets]
-        await ctx.send(f"🎮 게임 시작!\n참가자: {', '.join(names)}")
-    
-        # 🧭 첫 라운드 히트/스테이는 카드 분배 후 자동 시작
-        for u in sess.players:
-            # 자동 카드 분배가 끝나고 나서 첫 차례부터 버튼 생성
-            if mode == "bj":
-                await ctx.send(f"<@{u}> 님 차례입니다.", view=BlackjackPlayView(target_uid=u))
-            else:
-                await ctx.send(f"<@{u}> 님 차례입니다.", view=BlindPlayView(target_uid=u))
+    if uid not in sess.bets and len(sess.bets)>=sess.max_players: post(ctx.channel,"⚠️ 인원 마감.",HIGH); return
+    # 베팅액은 세션 id로 예치 — 다른 테이블에서 같은 돈을 다시 걸 수 없음
+    async with store.user_lock(uid):
+        if not await store.reserve(sess.sid,uid,uname,bet): post(ctx.channel,"❌ 소지금 부족.",HIGH); return
+        sessions=blackjack_sessions if mode=="bj" else blind_sessions
+        if sess.started or sessions.get(cid) is not sess:
+            await store.release(sess.sid,uid); post(ctx.channel,"⚠️ 이미 시작됨.",HIGH); return
+        sess.bets[uid]=bet
+        if uid not in sess.players:
+            sess.players[uid] = []  # 플레이어 등록
+        save_session(mode,sess,ctx.guild)
+    joined=f"✅ {uname} 참가 — 베팅 {bet}"
+    if not sess.everyone_joined():
+        # 참가 알림은 낮은 우선순위 — 연달아 들어오면 한 메시지로 합쳐짐
+        post(ctx.channel,joined); return
+
+    sess.started = True
+    # 🎴 카드 분배 (모두에게 2장씩)
+    for u in sess.bets:
+        sess.deal_initial(u)
+
+    # 🧭 마지막 참가 알림·분배 결과·히트/스테이 버튼을 테이블 메시지 하나로 (이후 라운드는 이 메시지를 수정)
+    events=[joined,f"✅ 참가자({sess.max_players}명) 전원 참가 완료! 🎮 게임 시작!"]
+    events.append("🃏 첫 패 분배 완료." if mode=="bj" else "🃏 첫 패 분배 완료. (카드 및 합계 비공개)")
+    save_session(mode,sess,ctx.guild)
+    post(ctx.channel,priority=HIGH,**table_message(ctx.guild,mode,sess,events))
 
 # ─────────────────────────────────────────────
-# ♠ 블랙잭 플레이 버튼
+# 🧾 테이블 메시지: 판마다 메시지 하나를 두고 이벤트마다 임베드를 수정
 # ─────────────────────────────────────────────
-class BlackjackPlayView(View):
-    def __init__(self, target_uid):
-        super().__init__(timeout=None)
-        self.target_uid=target_uid
-        self.add_item(BJHitButton())
-        self.add_item(BJStayButton())
+TITLES={"bj":"🃏 블랙잭","blind":"🃏 블라인드 블랙잭"}
 
-class BJHitButton(Button):
-    def __init__(self): super().__init__(label="히트",style=discord.ButtonStyle.success)
-    async def callback(self, inter):
-        cid,uid,uname=str(inter.channel.id),str(inter.user.id),inter.user.display_name
-        if cid not in blackjack_sessions: await inter.response.send_message("세션 없음",ephemeral=True);return
-        sess=blackjack_sessions[cid]
-        if uid!=self.view.target_uid: await inter.response.send_message("⛔ 본인만 조작",ephemeral=True);return
-        card=sess.hit(uid); sc=sess.score(uid)
-        if card[1:]=="A":
-            await inter.channel.send(f"{uname} 새 카드 {card} — A값 선택",view=AceChoiceView(uid,len(sess.players[uid])-1));return
-        if sc==21:
-            await inter.channel.send(f"🎉 {uname} 블랙잭! (합계 21)"); sess.stay(uid); sess.actions[uid]=True; await settle_and_end(inter,"bj",sess);return
-        if sc>21:
-            sess.busted.add(uid); await inter.channel.send(f"💥 {uname} 버스트! (합계 {sc})")
+def member_name(guild,u):
+    m=guild.get_member(int(u)); return m.display_name if m else f"UID:{u}"
+
+def table_message(guild,mode,sess,events):
+    e=discord.Embed(title=TITLES[mode],description="\n".join(events) or None,color=discord.Color.dark_red())
+    waiting=[]
+    for u in sess.players:
+        if u in sess.busted: tag="💥 버스트"
+        elif u in sess.stayed: tag="✋ 스테이"
+        elif mode=="bj" and u in sess.pending_ace: tag="🅰️ A값 선택 중"; waiting.append(u)
+        elif sess.actions.get(u): tag="✔️ 행동 완료"
+        else: tag="⏳ 차례"; waiting.append(u)
+        if mode=="bj": hand=f"{sess.hand(u)} (합계 {sess.score(u)})"
+        else: hand=f"{'🂠'*len(sess.players[u])} (비공개)"
+        e.add_field(name=f"{member_name(guild,u)} — 베팅 {sess.bets[u]}",value=f"{hand}\n{tag}",inline=False)
+    content=" ".join(f"<@{u}>" for u in waiting)+" 님 차례입니다." if waiting else None
+    # 메시지마다 버튼 뷰는 하나 — 이전 뷰는 멈춰 뷰 저장소에 쌓이지 않게 함
+    if sess.view: sess.view.stop()
+    sess.view=TableView(mode,ace_pending=mode=="bj" and bool(sess.pending_ace))
+    return {"content":content,"embed":e,"view":sess.view}
+
+async def show_table(inter,**kw):
+    # 버튼 응답 자체로 테이블 메시지를 수정 (REST 1회 + 상호작용 응답), 이미 defer 됐으면 원본 수정
+    async with ack_lock(inter):
+        if inter.response.is_done(): await inter.edit_original_response(**kw)
         else:
-            await inter.channel.send(f"{uname} → {' '.join(sess.players[uid])} (합계 {sc})")
-        sess.actions[uid]=True
-        if sess.everyone_acted():
-            if sess.is_finished(): await settle_and_end(inter,"bj",sess)
-            else:
-                sess.reset_actions()
-                for u in sess.players:
-                    if u not in sess.stayed|sess.busted:
-                        await inter.channel.send(f"<@{u}> 님 차례입니다.",view=BlackjackPlayView(target_uid=u))
-
-class BJStayButton(Button):
-    def __init__(self): super().__init__(label="스테이",style=discord.ButtonStyle.danger)
-    async def callback(self, inter):
-        cid,uid,uname=str(inter.channel.id),str(inter.user.id),inter.user.display_name
-        if cid not in blackjack_sessions: await inter.response.send_message("세션 없음",ephemeral=True);return
-        sess=blackjack_sessions[cid]
-        if uid!=self.view.target_uid: await inter.response.send_message("⛔ 본인만 조작",ephemeral=True);return
-        sess.stay(uid); sc=sess.score(uid)
-        await inter.channel.send(f"{uname} 스테이 (합계 {sc})")
-        if sess.everyone_acted():
-            if sess.is_finished(): await settle_and_end(inter,"bj",sess)
-            else:
-                sess.reset_actions()
-                for u in sess.players:
-                    if u not in sess.stayed|sess.busted:
-                        await inter.channel.send(f"<@{u}> 님 차례입니다.",view=BlackjackPlayView(target_uid=u))
-
-class AceChoiceView(View):
-    def __init__(self,target_uid,card_index):
-        super().__init__(timeout=None)
-        self.target_uid=target_uid; self.card_index=card_index
-        self.add_item(AceBtn(1)); self.add_item(AceBtn(11))
+            await inter.response.edit_message(**kw)
+            ACKS.inc(kind="response")
 
-class AceBtn(Button):
-    def __init__(self,val): super().__init__(label=f"A={val}",style=discord.ButtonStyle.primary if val==1 else discord.ButtonStyle.success); self.val=val
-    async def callback(self, inter):
-        cid,uid,uname=str(inter.channel.id),str(inter.user.id),inter.user.display_name
-        if cid not in blackjack_sessions: await inter.response.send_message("세션 없음",ephemeral=True);return
-        sess=blackjack_sessions[cid]
-        if uid!=self.view.target_uid: await inter.response.send_message("⛔ 본인만 조작",ephemeral=True);return
-        sess.ace_values[uid][self.view.card_index]=self.val; sc=sess.score(uid)
-        await inter.channel.send(f"{uname} A={self.val} 선택 → {' '.join(sess.players[uid])} (합계 {sc})")
-        if sc==21:
-            await inter.channel.send(f"🎉 {uname} 블랙잭! (합계 21)"); sess.stay(uid); sess.actions[uid]=True; await settle_and_end(inter,"bj",sess);return
-        if sc>21:
-            sess.busted.add(uid); await inter.channel.send(f"💥 {uname} 버스트! (합계 {sc})")
-        sess.actions[uid]=True
-        if sess.everyone_acted():
-            if sess.is_finished(): await settle_and_end(inter,"bj",sess)
-            else:
-                sess.reset_actions()
-                for u in sess.players:
-                    if u not in sess.stayed|sess.busted:
-                        await inter.channel.send(f"<@{u}> 님 차례입니다.",view=BlackjackPlayView(target_uid=u))
+async def advance(inter,mode,sess,events):
+    if sess.everyone_acted():
+        if sess.is_finished(): await settle_and_end(inter,mode,sess,events); return
+        sess.reset_actions(); events.append("🔁 다음 라운드")
+    save_session(mode,sess,inter.guild)
+    await show_table(inter,**table_message(inter.guild,mode,sess,events))
 
 # ─────────────────────────────────────────────
-# ♥ 블라인드 블랙잭 플레이 버튼
+# ♠♥ 테이블 버튼 (블랙잭: 히트/스테이/A값, 블라인드: 히트/스테이)
 # ─────────────────────────────────────────────
-class BlindPlayView(View):
-    def __init__(self,target_uid):
+class TableView(View):
+    def __init__(self,mode,ace_pending=False):
         super().__init__(timeout=None)
-        self.target_uid=target_uid
-        self.add_item(BlindHitButton())
-        self.add_item(BlindStayButton())
+        if mode=="bj":
+            self.add_item(TableButton(mode,"hit","히트",discord.ButtonStyle.success))
+            self.add_item(TableButton(mode,"stay","스테이",discord.ButtonStyle.danger))
+            self.add_item(TableButton(mode,"ace1","A=1",discord.ButtonStyle.primary,disabled=not ace_pending))
+            self.add_item(TableButton(mode,"ace11","A=11",discord.ButtonStyle.success,disabled=not ace_pending))
+        else:
+            self.add_item(TableButton(mode,"hit","히트(비공개)",discord.ButtonStyle.success))
+            self.add_item(TableButton(mode,"stay","스테이",discord.ButtonStyle.danger))
+
+class TableButton(Button):
+    def __init__(self,mode,action,label,style,disabled=False):
+        super().__init__(label=label,style=style,custom_id=f"{mode}:{action}",disabled=disabled)
+        self.mode,self.action=mode,action
 
-class BlindHitButton(Button):
-    def __init__(self): super().__init__(label="히트(비공개)",style=discord.ButtonStyle.success)
+    @metered
+    @acked
     async def callback(self, inter):
         cid,uid,uname=str(inter.channel.id),str(inter.user.id),inter.user.display_name
-        if cid not in blind_sessions: await inter.response.send_message("세션 없음",ephemeral=True);return
-        sess=blind_sessions[cid]
-        if uid!=self.view.target_uid: await inter.response.send_message("⛔ 본인만 조작",ephemeral=True);return
+        sess=(blackjack_sessions if self.mode=="bj" else blind_sessions).get(cid)
+        if sess is None: await reply(inter,"세션 없음",ephemeral=True);return
+        if uid not in sess.players: await reply(inter,"⛔ 참가자만 조작",ephemeral=True);return
+        if sess.ended:
+            # 승패는 정해졌고 정산만 남은 판 (이전 정산 실패 또는 재시작 후 복원)
+            if sess.sid in settling: await reply(inter,"⏳ 정산 중입니다.",ephemeral=True)
+            else: await settle_and_end(inter,self.mode,sess,["🔁 정산 다시 시도"])
+            return
+        if not sess.started: await reply(inter,"⏳ 아직 시작 전입니다.",ephemeral=True);return
+        if self.action in ("ace1","ace11"):
+            if uid not in sess.pending_ace: await reply(inter,"선택할 A가 없습니다.",ephemeral=True);return
+            await self.choose_ace(inter,sess,uid,uname,1 if self.action=="ace1" else 11);return
+        if self.mode=="bj" and uid in sess.pending_ace: await reply(inter,"⚠️ 먼저 A값을 선택하세요.",ephemeral=True);return
+        if uid in sess.stayed|sess.busted or sess.actions.get(uid): await reply(inter,"⏳ 이번 라운드 행동 완료",ephemeral=True);return
+        if self.action=="stay":
+            sess.stay(uid); sc=sess.score(uid)
+            await advance(inter,self.mode,sess,[f"{uname} 스테이 (합계 {sc}{', 비공개' if self.mode=='blind' else ''})"]);return
+        if self.mode=="bj": await self.bj_hit(inter,sess,uid,uname)
+        else: await self.blind_hit(inter,sess,uid,uname)
+
+    async def bj_hit(self,inter,sess,uid,uname):
         card=sess.hit(uid); sc=sess.score(uid)
+        if IS_ACE[card]:
+            await advance(inter,"bj",sess,[f"{uname} 새 카드 {card_str(card)} — A값 선택"]);return
+        await self.bj_result(inter,sess,uid,uname,sc,[f"{uname} → {sess.hand(uid)} (합계 {sc})"])
+
+    async def choose_ace(self,inter,sess,uid,uname,val):
+        sess.choose_ace(uid,val); sc=sess.score(uid)
+        await self.bj_result(inter,sess,uid,uname,sc,[f"{uname} A={val} 선택 → {sess.hand(uid)} (합계 {sc})"])
+
+    async def bj_result(self,inter,sess,uid,uname,sc,events):
         if sc==21:
-            await inter.channel.send(f"🎉 {uname} 블랙잭! (합계 21, 비공개)")
-            sess.stay(uid); sess.actions[uid]=True; await settle_and_end(inter,"blind",sess);return
+            events.append(f"🎉 {uname} 블랙잭! (합계 21)"); sess.stay(uid); await settle_and_end(inter,"bj",sess,events);return
         if sc>21:
-            sess.busted.add(uid); await inter.channel.send(f"💥 {uname} 버스트! (합계 {sc}, 비공개)")
-        else:
-            await inter.channel.send(f"{uname} 히트 완료 (합계 {sc}, 비공개)")
+            sess.busted.add(uid); events.append(f"💥 {uname} 버스트! (합계 {sc})")
         sess.actions[uid]=True
-        if sess.everyone_acted():
-            if sess.is_finished(): await settle_and_end(inter,"blind",sess)
-            else:
-                sess.reset_actions()
-                for u in sess.players:
-                    if u not in sess.stayed|sess.busted:
-                        await inter.channel.send(f"<@{u}> 님 차례입니다.",view=BlindPlayView(target_uid=u))
-
-class BlindStayButton(Button):
-    def __init__(self): super().__init__(label="스테이",style=discord.ButtonStyle.danger)
-    async def callback(self, inter):
-        cid,uid,uname=str(inter.channel.id),str(inter.user.id),inter.user.display_name
-        if cid not in blind_sessions: await inter.response.send_message("세션 없음",ephemeral=True);return
-        sess=blind_sessions[cid]
-        if uid!=self.view.target_uid: await inter.response.send_message("⛔ 본인만 조작",ephemeral=True);return
-        sess.stay(uid); sc=sess.score(uid)
-        await inter.channel.send(f"{uname} 스테이 (합계 {sc}, 비공개)")
-        if sess.everyone_acted():
-            if sess.is_finished(): await settle_and_end(inter,"blind",sess)
-            else:
-                sess.reset_actions()
-                for u in sess.players:
-                    if u not in sess.stayed|sess.busted:
-                        await inter.channel.send(f"<@{u}> 님 차례입니다.",view=BlindPlayView(target_uid=u))
+        await advance(inter,"bj",sess,events)
+
+    async def blind_hit(self,inter,sess,uid,uname):
+        sess.hit(uid); sc=sess.score(uid)
+        if sc==21:
+            sess.stay(uid); await settle_and_end(inter,"blind",sess,[f"🎉 {uname} 블랙잭! (합계 21, 비공개)"]);return
+        if sc>21:
+            sess.busted.add(uid); events=[f"💥 {uname} 버스트! (합계 {sc}, 비공개)"]
+        else:
+            events=[f"{uname} 히트 완료 (합계 {sc}, 비공개)"]
+        await advance(inter,"blind",sess,events)
 
 # ─────────────────────────────────────────────
 # 💰 정산
 # ─────────────────────────────────────────────
-async def settle_and_end(inter,mode,sess):
-    ch=inter.channel
+settling=set()  # 정산 중인 세션 id
+
+async def settle_and_end(inter,mode,sess,events=()):
+    # 승패와 전체 패 공개를 테이블 메시지 한 번 수정으로 (버튼 제거)
+    sessions=blackjack_sessions if mode=="bj" else blind_sessions
+    # 버튼이 동시에 눌려도 한 번만 정산
+    if sessions.get(sess.cid) is not sess or sess.sid in settling: return
+    settling.add(sess.sid); sess.ended=True
     scores={u:sess.score(u) for u in sess.players}
-    alive={u:s for u,s in scores.items() if s<=21}
-    lines=[]
+    names={u:member_name(inter.guild,u) for u in sess.players}
+    # 모든 증감을 먼저 계산한 뒤 한 번에 반영 (세션 id로 중복 지급 방지)
+    winners=sess.winners(); payouts=sess.payouts()
+    try:
+        await store.settle(sess.sid,[(u,names[u],d) for u,d in payouts.items()])
+    except Exception as e:
+        # 테이블·예치금·저널은 그대로 두고, 다음 버튼에서 같은 세션 id로 다시 정산 (유휴 정리 대상으로도 남음)
+        print(f"⚠️ 정산 실패 {sess.cid}: {e!r}")
+        save_session(mode,sess,inter.guild)
+        post(inter.channel,"⚠️ 정산 중 저장소 오류가 났습니다. 베팅은 그대로 묶여 있으니 테이블 버튼을 눌러 다시 정산하세요.",HIGH)
+        return
+    finally:
+        settling.discard(sess.sid)
+    if sessions.get(sess.cid) is sess: del sessions[sess.cid]
+    drop_session(sess)
+    journal.submit(records.record,sess.sid,mode,
+                   [(u,WIN if u in winners else BUST if scores[u]>21 else LOSS,scores[u],payouts[u]) for u in sess.players])
+    lines=list(events)
+    if not winners:
+        lines.append("모두 버스트! 전원 패배.")
+    else:
+        for u in sess.players:
+            n=names[u]; b=sess.bets[u]
+            lines.append(f"🏆 {n} 승리! (+{b})" if u in winners else f"❌ {n} 패배 (-{b})")
+    e=discord.Embed(title=TITLES[mode]+" — 결과",description="\n".join(lines),color=discord.Color.gold())
     for u in sess.players:
-        m=ch.guild.get_member(int(u)); n=m.display_name if m else u; s=scores[u]
+        s=scores[u]
         if mode=="bj":
-            cards=" ".join(sess.players[u])
-            lines.append(f"**{n}** → {cards} ({'버스트' if s>21 else s})")
+            hand=f"{sess.hand(u)} ({'버스트' if s>21 else s})"
         else:
-            cards = " ".join(sess.hidden_info[u]["cards"])
-            score = sess.hidden_info[u]["score"]
-            lines.append(f"**{n}** → {cards} (합계 {score}{' 버스트' if score>21 else ''})")
-    if not alive:
-        await ch.send("모두 버스트! 전원 패배.")
-        for u,b in sess.bets.items(): add_balance(u,ch.guild.get_member(int(u)).display_name,-b)
-    else:
-        max_s=max(alive.values()); winners=[u for u,s in alive.items() if s==max_s]
-        for u in sess.players:
-            m=ch.guild.get_member(int(u)); n=m.display_name if m else u; b=sess.bets[u]
-            if u in winners: add_balance(u,n,b); await ch.send(f"🏆 {n} 승리! (+{b})")
-            else: add_balance(u,n,-b); await ch.send(f"❌ {n} 패배 (-{b})")
-    await ch.send("🃏 결과\n"+"\n".join(lines))
+            hand=f"{sess.hand(u)} (합계 {s}{' 버스트' if s>21 else ''})"
+        e.add_field(name=names[u],value=hand,inline=False)
+    e.set_footer(text="🎮 게임 종료! !세팅으로 새 게임을 시작하세요.")
     shuffle_decks(sess.cid)
-    if mode=="bj": del blackjack_sessions[sess.cid]
-    else: del blind_sessions[sess.cid]
-    await ch.send("🎮 게임 종료! `!세팅`으로 새 게임을 시작하세요.")
+    if sess.view: sess.view.stop()
+    await show_table(inter,content=None,embed=e,view=None)
 
 # ─────────────────────────────────────────────
-bot.run(DISCORD_TOKEN)
+# 🚀 실행
+# ─────────────────────────────────────────────
+def run_bot():
+    # 시트는 건드리지 않고 바로 접속 — 시트 준비는 on_ready 뒤 warm_up()에서
+    if ledger.open(): store.ready.set()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT + PROCESS_INDEX)
+        print(f"📈 /metrics :{METRICS_PORT + PROCESS_INDEX}")
+    print(f"♻️ 진행 중이던 테이블 {restore_sessions()}개 복원")
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        try: ledger.flush()
+        except Exception as e: print(f"⚠️ 종료 전 시트 반영 실패: {e!r}")
+        store.close()
+        journal.close()
+        records.close()
+
+def run_supervisor():
+    # 샤드를 프로세스 수로 나눠 자식 프로세스로 실행, 하나라도 죽으면 전부 내리고 종료
+    # 공유 DB가 처음이면 0번 프로세스가 시트로 채우고, 나머지는 채워질 때까지 warm_up에서 기다림
+    count = SHARD_COUNT or BOT_PROCESSES
+    if BOT_PROCESSES > count:
+        sys.exit(f"BOT_PROCESSES({BOT_PROCESSES})가 SHARD_COUNT({count})보다 많습니다 — 샤드 없는 프로세스는 띄우지 않습니다.")
+    procs = []
+    for i in range(BOT_PROCESSES):
+        ids = [s for s in range(count) if s % BOT_PROCESSES == i]
+        env = {**os.environ, "BOT_PROCESSES": "1", "BOT_PROCESS_INDEX": str(i),
+               "SHARD_COUNT": str(count), "SHARD_IDS": ",".join(map(str, ids))}
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(1)
+    finally:
+        for p in procs:
+            if p.poll() is None: p.terminate()
+        for p in procs:
+            p.wait()
+
+if __name__ == "__main__":
+    # Heroku 종료(SIGTERM) 시에도 남은 변경을 시트에 반영
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if sys.argv[1:2] == ["rebuild-sheet"]:
+        # 장부 로그로 "소지금" 시트를 다시 씀 (봇은 띄우지 않음). 로그가 비어 있으면 거부하고,
+        # 로그에 없는 uid의 행은 --force 일 때만 지운다 (없으면 시트 값 그대로 남김)
+        if sys.argv[2:] not in ([], ["--force"]): sys.exit("사용법: python main.py rebuild-sheet [--force]")
+        ledger.open()
+        n, kept = ledger.rebuild_sheet(force=sys.argv[2:] == ["--force"])
+        print(f"📄 소지금 시트 재작성: {n}행" + (f" (장부 로그에 없어 시트 값 그대로 남긴 행 {kept}개)" if kept else ""))
+    elif BOT_PROCESSES > 1: run_supervisor()
+    else: run_bot()
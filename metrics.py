@@ -0,0 +1,153 @@
+# 📈 메트릭 (Prometheus 텍스트 형식) — 디스코드와 무관, 어느 스레드에서나 기록 가능
+# 카운터/게이지/히스토그램을 모듈 전역에 등록해 두고 /metrics 요청 때 한 번에 텍스트로 만든다.
+import threading, time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REGISTRY = []
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def _num(v):
+    return "+Inf" if v == float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.values = {}  # 라벨 값 튜플 -> 값
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(k, "")) for k in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, k, v) for k, v in self.values.items()]
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, v, *extra in self.samples():
+            out.append(f"{name}{_labels(self.labelnames, key, *extra)} {_num(v)}")
+        return out
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, n=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn  # 수집 때 호출: 숫자 또는 {라벨 값 튜플: 숫자}
+
+    def set(self, v, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = v
+
+    def samples(self):
+        if self.fn is None:
+            return super().samples()
+        v = self.fn()
+        if not isinstance(v, dict):
+            v = {(): v}
+        return [(self.name, k, x) for k, x in v.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, v, **labels):
+        key = self._key(labels)
+        with self.lock:
+            h = self.values.get(key)
+            if h is None:
+                h = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]  # 구간별 개수, 합계
+            i = bisect_left(self.buckets, v)
+            h[0][i] += 1
+            h[1] += v
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            items = [(k, list(h[0]), h[1]) for k, h in self.values.items()]
+        for key, counts, total in items:
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                out.append((self.name + "_bucket", key, acc, (("le", _num(le)),)))
+            out.append((self.name + "_sum", key, total))
+            out.append((self.name + "_count", key, acc))
+        return out
+
+class Timer:
+    # with HIST.time(...) as t: — 블록이 예외로 끝나면 outcome 라벨이 "error"
+    def __init__(self, hist, labels):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if "outcome" in self.hist.labelnames:
+            labels = {**labels, "outcome": "error" if exc_type else "ok"}
+        self.hist.observe(time.perf_counter() - self.t0, **labels)
+        return False
+
+def render():
+    lines = []
+    for m in list(REGISTRY):
+        try:
+            lines += m.render()
+        except Exception as e:  # 수집 함수 하나가 실패해도 나머지는 내보냄
+            lines.append(f"# {m.name} 수집 실패: {e!r}")
+    return "\n".join(lines) + "\n"
+
+# ─────────────────────────────────────────────
+# 🌐 /metrics 엔드포인트: Flask를 별도 스레드에서 (봇 이벤트 루프와 무관)
+# ─────────────────────────────────────────────
+def serve(port, host="0.0.0.0"):
+    from flask import Flask, Response
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *a, **kw):
+            pass  # 스크레이프마다 접근 로그를 남기지 않음 (오류 로그는 그대로)
+
+    app = Flask("casino-metrics")
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    server = make_server(host, port, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+# ─────────────────────────────────────────────
+# 공통 메트릭 (저장소/시트 — storage.py와 main.py가 같이 기록)
+# ─────────────────────────────────────────────
+STORAGE_SECONDS = Histogram("casino_storage_seconds", "저장소 호출 시간 (대기 포함)", ("op", "outcome"))
+SHEETS_CALLS = Counter("casino_sheets_calls_total", "Google Sheets API 호출 수", ("kind", "op"))
+SHEETS_SECONDS = Histogram("casino_sheets_seconds", "Google Sheets API 호출 시간", ("kind", "op", "outcome"))
@@ -0,0 +1,54 @@
+# 🎰 미니게임 일괄 플레이 (디스코드와 무관)
+# N판 결과를 NumPy로 한 번에 뽑고, 결과별 배당표(베팅 1당 순증감)로 총 증감을 계산한다.
+#   슬롯: 릴 3개 × 심볼 8개 — 잭팟 +20, 더블 +1, 꽝 -1 (하우스 엣지 1.6%)
+#   홀짝 / 가위바위보 / 야바위 / 다이스: 고른 값에 거는 공정 배당 (기대값 0)
+import numpy as np
+
+SLOT_SYMBOLS = ['❤️', '💔', '💖', '💝', '🔴', '🔥', '🦋', '💥']
+RPS = ['가위', '바위', '보']
+
+class MiniGame:
+    __slots__ = ("key", "title", "labels", "payouts", "picks", "default", "draw")
+
+    def __init__(self, key, title, labels, payouts, draw, picks=None, default=None):
+        self.key, self.title = key, title
+        self.labels = labels                               # 결과 번호 -> 이름
+        self.payouts = np.asarray(payouts, dtype=np.int64)  # 결과 번호 -> 베팅 1당 순증감
+        self.draw = draw                                   # (rng, n, 선택) -> 결과 번호 배열
+        self.picks, self.default = picks, default          # 고를 수 있는 값 (None: 선택 없음)
+
+def _slot(rng, n, pick):
+    r = rng.integers(0, len(SLOT_SYMBOLS), size=(n, 3))
+    same = (r[:, 0] == r[:, 1]).astype(np.int8) + (r[:, 1] == r[:, 2]) + (r[:, 0] == r[:, 2])
+    return np.where(same == 3, 0, np.where(same == 1, 1, 2))  # 0 잭팟 / 1 더블 / 2 꽝
+
+def _odd(rng, n, pick):
+    odd = rng.integers(1, 7, size=n) % 2 == 1
+    return np.where(odd == (pick == "홀"), 0, 1)
+
+def _rps(rng, n, pick):
+    # (내 손 - 봇 손) % 3 — 0 무승부 / 1 승 / 2 패
+    return (RPS.index(pick) - rng.integers(0, 3, size=n)) % 3
+
+def _shell(rng, n, pick):
+    return np.where(rng.integers(1, 4, size=n) == int(pick), 0, 1)
+
+def _dice(rng, n, pick):
+    return np.where(rng.integers(1, 7, size=n) == int(pick), 0, 1)
+
+GAMES = {g.key: g for g in (
+    MiniGame("slot", "🎰 슬롯", ["💥 잭팟", "💎 더블", "❌ 꽝"], [20, 1, -1], _slot),
+    MiniGame("odd", "⚪ 홀짝", ["승", "패"], [1, -1], _odd, ["홀", "짝"], "홀"),
+    MiniGame("rps", "✂️ 가위바위보", ["무승부", "승", "패"], [0, 1, -1], _rps, RPS, "바위"),
+    MiniGame("shell", "🎲 야바위", ["적중", "꽝"], [2, -1], _shell, ["1", "2", "3"], "1"),
+    MiniGame("dice", "🎲 다이스", ["적중", "꽝"], [5, -1], _dice, [str(i) for i in range(1, 7)], "6"),
+)}
+
+_rng = np.random.default_rng()
+
+def play(key, n, bet, pick=None, rng=None):
+    # n판을 한 번에: ({결과 이름: 횟수}, 총 증감)
+    g = GAMES[key]
+    out = g.draw(rng or _rng, n, pick or g.default)
+    counts = np.bincount(out, minlength=len(g.labels))
+    return dict(zip(g.labels, counts.tolist())), int(counts @ g.payouts) * bet
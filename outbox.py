@@ -0,0 +1,109 @@
+# 📮 채널별 발신 큐 — 핸들러는 넣기만 하고 기다리지 않는다
+# 채널마다 토큰 버킷(기본: 디스코드 채널 메시지 한도 5개/5초)으로 속도를 맞추고,
+# 429를 받으면 Retry-After 만큼 그 채널만 멈췄다가 같은 메시지를 다시 보낸다.
+# 급한 메시지(HIGH)는 쌓여 있는 LOW 메시지를 앞지르고, 텍스트뿐인 LOW 메시지는 한 통으로 합친다.
+import asyncio, time
+from collections import deque
+
+HIGH, LOW = 0, 1
+MAX_CONTENT = 2000  # 디스코드 메시지 길이 한도
+
+class TokenBucket:
+    def __init__(self, rate=1.0, burst=5):
+        self.rate, self.burst = rate, burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        # 다음 토큰까지 남은 시간 (0이면 바로 가능)
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def take(self):
+        while (d := self.delay()) > 0:
+            await asyncio.sleep(d)
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        # 429: 남은 토큰을 버리고 seconds 동안 멈춤
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class Outbox:
+    def __init__(self, send, rate=1.0, burst=5, on_error=None, on_sent=None):
+        self.send = send          # async (kwargs) -> 보낸 메시지
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = (deque(), deque())  # 우선순위별 [(kwargs, 합칠 수 있는지, [future])]
+        self.task = None
+        self.on_error = on_error  # (예외) — 보내기 실패 (429 제외)
+        self.on_sent = on_sent    # (합쳐진 메시지 수)
+
+    @property
+    def pending(self):
+        return sum(map(len, self.queues)) + (self.task is not None and not self.task.done())
+
+    def put(self, priority=LOW, coalesce=None, **kw):
+        # 텍스트뿐인 LOW 메시지는 기본적으로 합칠 수 있음
+        if coalesce is None:
+            coalesce = priority == LOW and set(kw) == {"content"}
+        fut = asyncio.get_running_loop().create_future()
+        q = self.queues[priority]
+        last = q[-1] if q else None
+        if coalesce and last and last[1] and len(last[0]["content"]) + len(kw["content"]) + 1 <= MAX_CONTENT:
+            last[0]["content"] += "\n" + kw["content"]
+            last[2].append(fut)
+        else:
+            q.append((kw, coalesce, [fut]))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._drain())
+        return fut
+
+    def _next(self):
+        for q in self.queues:
+            if q:
+                return q
+        return None
+
+    async def _drain(self):
+        while self._next() is not None:
+            await self.bucket.take()
+            q = self._next()  # 기다리는 동안 더 급한 메시지가 들어왔을 수 있음
+            item = q.popleft()  # 보내는 중인 메시지에는 더 합치지 않도록 먼저 뺀다
+            kw, _, futs = item
+            try:
+                msg = await self.send(kw)
+            except Exception as e:
+                retry = _retry_after(e)
+                if retry is not None:
+                    self.bucket.pause(retry)
+                    q.appendleft(item)  # 맨 앞에 다시 넣고 재시도
+                    continue
+                if self.on_error:
+                    self.on_error(e)
+                for f in futs:
+                    if not f.done():
+                        f.set_exception(e)
+                        f.exception()  # 아무도 기다리지 않아도 경고가 나지 않게
+                continue
+            if self.on_sent:
+                self.on_sent(len(futs))
+            for f in futs:
+                if not f.done(): f.set_result(msg)
+
+def _retry_after(e):
+    # discord.HTTPException(status=429) 이면 Retry-After 초, 아니면 None
+    if getattr(e, "status", None) != 429:
+        return None
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1))
+    except (TypeError, ValueError):
+        return 1.0
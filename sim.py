@@ -0,0 +1,182 @@
+# 🎲 블랙잭 몬테카를로 시뮬레이터 (디스코드 없이 실행)
+#   python sim.py --hands 1000000 --mode bj --threshold 17
+#   python sim.py --path session --hands 20000 --mode blind --threshold 15 16 17
+#
+# 규칙은 봇과 동일: 라운드마다 남은 사람이 한 번씩 히트/스테이, 히트로 21이 되면 그 자리에서
+# 게임 종료, 21 이하 최고 점수 전원 승리(+베팅), 나머지와 전원 버스트 시 전원 패배(-베팅).
+# 블랙잭은 처음 두 장의 A를 11로, 히트로 받은 A는 21을 넘지 않으면 11 아니면 1로 고른다.
+#
+# --path vector  : NumPy로 테이블 수십만 개를 한꺼번에 진행 (무한 덱 근사 — 카드는 복원 추출)
+# --path session : blackjack.py의 세션 클래스와 슈를 그대로 사용 (정확, 느림)
+# 두 경로 모두 --workers 개의 프로세스로 나눠 돈다.
+import argparse, os, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from blackjack import BlackjackSession, BlindBlackjackSession, ShoePool, IS_ACE, VALUE_HIGH, VALUE_LOW
+
+CHUNK = 200_000
+# 랭크(0=A … 12=K)별 점수 — 세션과 같은 표에서 한 무늬(카드 0~12)만 잘라 씀
+RANK_HIGH = np.array(VALUE_HIGH[:13], dtype=np.int16)
+RANK_LOW = np.array(VALUE_LOW[:13], dtype=np.int16)
+
+# ─────────────────────────────────────────────
+# 집계: 자리별 승리/공동 승리/버스트 횟수와 증감 합, 전원 버스트 판 수
+# ─────────────────────────────────────────────
+def empty_stats(seats):
+    return {"hands": 0, "all_bust": 0, "ended_21": 0,
+            "win": np.zeros(seats, np.int64), "tie": np.zeros(seats, np.int64),
+            "bust": np.zeros(seats, np.int64), "net": np.zeros(seats, np.int64)}
+
+def merge(a, b):
+    for k in a:
+        a[k] = a[k] + b[k]
+    return a
+
+# ─────────────────────────────────────────────
+# 벡터 경로
+# ─────────────────────────────────────────────
+def simulate_vector(n, seats, mode, thresholds, seed):
+    rng = np.random.default_rng(seed)
+    values = RANK_HIGH if mode == "bj" else RANK_LOW
+    thr = np.broadcast_to(np.asarray(thresholds, dtype=np.int16), (seats,))
+    tot = values[rng.integers(0, 13, size=(n, seats))] + values[rng.integers(0, 13, size=(n, seats))]
+    busted = tot > 21  # 블랙잭에서 A 두 장(22)은 시작부터 버스트
+    stayed = np.zeros((n, seats), bool)
+    done = np.zeros(n, bool)  # 누군가 히트로 21을 만들어 끝난 판
+    while True:
+        for s in range(seats):
+            active = ~(done | stayed[:, s] | busted[:, s])
+            hit = active & (tot[:, s] < thr[s])
+            stayed[active & ~hit, s] = True
+            idx = np.flatnonzero(hit)
+            if not len(idx):
+                continue
+            ranks = rng.integers(0, 13, size=len(idx))
+            t = tot[idx, s] + values[ranks]
+            if mode == "bj":
+                t = np.where((ranks == 0) & (t > 21), t - 10, t)  # 히트로 받은 A는 1로
+            tot[idx, s] = t
+            busted[idx[t > 21], s] = True
+            hit21 = idx[t == 21]
+            stayed[hit21, s] = True
+            done[hit21] = True
+        if not (~(done[:, None] | stayed | busted)).any():
+            break
+    alive = tot <= 21
+    best = np.where(alive, tot, -1).max(axis=1)
+    win = alive & (tot == best[:, None])
+    shared = win & (win.sum(axis=1) > 1)[:, None]
+    st = empty_stats(seats)
+    st["hands"] = n
+    st["all_bust"] = int((best < 0).sum())
+    st["ended_21"] = int(done.sum())
+    st["win"] += win.sum(axis=0)
+    st["tie"] += shared.sum(axis=0)
+    st["bust"] += (~alive).sum(axis=0)
+    st["net"] += np.where(win, 1, -1).sum(axis=0)
+    return st
+
+# ─────────────────────────────────────────────
+# 세션 경로: 봇이 쓰는 세션 클래스와 슈로 한 판씩
+# ─────────────────────────────────────────────
+def play_session(mode, seats, shoe, thresholds):
+    cls = BlackjackSession if mode == "bj" else BlindBlackjackSession
+    sess = cls("sim", shoe, seats)
+    uids = [str(i) for i in range(seats)]
+    for u in uids:
+        sess.players[u], sess.bets[u] = [], 1
+        sess.deal_initial(u)
+        if sess.score(u) > 21:
+            sess.busted.add(u)
+    ended = False
+    while not ended and not sess.is_finished():
+        for u, t in zip(uids, thresholds):
+            if u in sess.stayed or u in sess.busted:
+                continue
+            if sess.score(u) >= t:
+                sess.stay(u)
+                continue
+            card = sess.hit(u)
+            if mode == "bj" and IS_ACE[card]:
+                sess.choose_ace(u, 11 if sess.score(u) <= 21 else 1)
+            sc = sess.score(u)
+            if sc == 21:
+                sess.stay(u); ended = True; break
+            if sc > 21:
+                sess.busted.add(u)
+        sess.reset_actions()
+    return sess, ended
+
+def simulate_session(n, seats, mode, thresholds, seed, decks=1, penetration=0.75):
+    thr = list(np.broadcast_to(np.asarray(thresholds), (seats,)))
+    pool = ShoePool(decks, penetration, size=16, seed=seed)
+    shoe = pool.shoe()
+    st = empty_stats(seats)
+    st["hands"] = n
+    for _ in range(n):
+        sess, ended = play_session(mode, seats, shoe, thr)
+        winners, pay = sess.winners(), sess.payouts()
+        st["all_bust"] += not winners
+        st["ended_21"] += ended
+        for i in range(seats):
+            u = str(i)
+            st["win"][i] += u in winners
+            st["tie"][i] += u in winners and len(winners) > 1
+            st["bust"][i] += sess.score(u) > 21
+            st["net"][i] += pay[u]
+        if shoe.needs_shuffle:
+            shoe.reload()
+    return st
+
+# ─────────────────────────────────────────────
+# 실행/보고
+# ─────────────────────────────────────────────
+def run(hands, seats, mode="bj", thresholds=17, path="vector", workers=1, seed=None, decks=1):
+    chunk = CHUNK if path == "vector" else max(1, hands // max(workers, 1) // 4 or 1)
+    sizes = [min(chunk, hands - i) for i in range(0, hands, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    fn = simulate_vector if path == "vector" else simulate_session
+    args = [(k, seats, mode, thresholds, sd) for k, sd in zip(sizes, seeds)]
+    if path == "session":
+        args = [a + (decks,) for a in args]
+    total = empty_stats(seats)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as ex:
+            for st in ex.map(fn, *zip(*args)):
+                merge(total, st)
+    else:
+        for a in args:
+            merge(total, fn(*a))
+    return total
+
+def report(st, seats, mode, thresholds, elapsed):
+    n = st["hands"]
+    title = "블랙잭" if mode == "bj" else "블라인드 블랙잭"
+    print(f"\n== {title} {seats}인, 기준 {thresholds}, {n:,}판 — {n / elapsed:,.0f}판/초 ==")
+    print("자리   승리     공동승리  버스트    기대값(베팅 1당)")
+    for i in range(seats):
+        print(f"{i + 1:>3}  {st['win'][i] / n:7.2%}  {st['tie'][i] / n:7.2%}  {st['bust'][i] / n:7.2%}  {st['net'][i] / n:+.4f}")
+    house = -st["net"].sum() / (n * seats)
+    print(f"전원 버스트 {st['all_bust'] / n:.2%} · 히트 21로 조기 종료 {st['ended_21'] / n:.2%} · "
+          f"하우스 엣지(베팅 1당 하우스 수익) {house:+.4f}")
+
+def main():
+    ap = argparse.ArgumentParser(description="블랙잭 변형 몬테카를로 시뮬레이터")
+    ap.add_argument("--hands", type=int, default=1_000_000)
+    ap.add_argument("--seats", type=int, nargs="+", default=[2, 3, 4])
+    ap.add_argument("--mode", choices=["bj", "blind"], default="bj")
+    ap.add_argument("--threshold", type=int, nargs="+", default=[17],
+                    help="이 점수 미만이면 히트 (자리별로 여러 개 지정 가능)")
+    ap.add_argument("--path", choices=["vector", "session"], default="vector")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--decks", type=int, default=1, help="세션 경로의 슈 덱 수")
+    ap.add_argument("--seed", type=int)
+    a = ap.parse_args()
+    for seats in a.seats:
+        thr = (a.threshold * seats)[:seats] if len(a.threshold) > 1 else a.threshold[0]
+        t0 = time.perf_counter()
+        st = run(a.hands, seats, a.mode, thr, a.path, a.workers, a.seed, a.decks)
+        report(st, seats, a.mode, thr, time.perf_counter() - t0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,816 @@
+# 💾 소지금 저장소
+# 장부(BalanceLedger / SQLiteLedger)가 잔액의 원본이고, "소지금" 시트에는
+# 변경된 행만 모아 주기적으로 batch_update 한 번에 기록한다 (write-behind).
+import re, threading, asyncio, time, sqlite3, weakref
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from metrics import STORAGE_SECONDS
+
+KST = timezone(timedelta(hours=9))
+START_BALANCE = 100
+SETTLED_KEEP = 1000  # 메모리에 기억해 둘 정산 키 개수 (그 밖은 ledger_log.ref 로 확인)
+
+def now_kst_str(fmt="%Y-%m-%d %H:%M:%S"):
+    return datetime.now(KST).strftime(fmt)
+
+def _first_row(resp):
+    # append_rows 응답의 updatedRange("'소지금'!A12:D14")에서 시작 행 번호
+    rng = ((resp or {}).get("updates") or {}).get("updatedRange") or ""
+    m = re.search(r"[A-Z]+(\d+)", rng.split("!")[-1])
+    return int(m.group(1)) if m else None
+
+# ─────────────────────────────────────────────
+# 🔎 uid → 시트 행 번호 색인
+# 한 번 만들어 두고 append 때 갱신, 마지막 행만 읽어 싸게 검증한다.
+# ─────────────────────────────────────────────
+class RowIndex:
+    def __init__(self, revalidate_interval=60.0):
+        self.rows = {}       # uid -> 행 번호
+        self.last = 0        # 색인이 아는 마지막 데이터 행
+        self.last_uid = None
+        self.revalidate_interval = revalidate_interval
+        self.checked_at = 0.0
+
+    def __contains__(self, uid):
+        return uid in self.rows
+
+    def __getitem__(self, uid):
+        return self.rows[uid]
+
+    def get(self, uid):
+        return self.rows.get(uid)
+
+    def build(self, col_a):
+        self.rows, self.last, self.last_uid = {}, 0, None
+        for idx, v in enumerate(col_a, start=1):
+            uid = (v or "").strip()
+            if uid:
+                self.rows.setdefault(uid, idx)
+                self.last, self.last_uid = idx, uid
+        self.checked_at = time.monotonic()
+
+    def add(self, uid, row):
+        self.rows[uid] = row
+        if row >= self.last:
+            self.last, self.last_uid = row, uid
+
+    def stale(self, sh):
+        # 마지막 행과 그 다음 행의 A열만 읽어 시트가 바깥에서 바뀌었는지 확인
+        if time.monotonic() - self.checked_at < self.revalidate_interval:
+            return False
+        self.checked_at = time.monotonic()
+        if not self.last:
+            return False
+        got = [(r[0] if r else "").strip() for r in sh.get(f"A{self.last}:A{self.last + 1}")]
+        return got[:1] != [self.last_uid] or any(got[1:])
+
+# ─────────────────────────────────────────────
+# 📤 "소지금" 시트 미러: 행 묶음을 batch_update / append_rows 로 내보냄
+# ─────────────────────────────────────────────
+class SheetMirror:
+    def __init__(self, open_sheet, revalidate_interval=60.0):
+        self.open_sheet = open_sheet  # () -> 소지금 Worksheet
+        self.index = RowIndex(revalidate_interval)
+        self.loaded = False  # 색인이 만들어지기 전에는 내보내지 않음 (중복 append 방지)
+        self.lock = threading.Lock()
+
+    def load(self):
+        # 시트 전체를 한 번 읽어 색인을 만들고 {uid: [이름, 소지금, 갱신시각]} 반환
+        values = self.open_sheet().get_all_values()
+        index = RowIndex(self.index.revalidate_interval)
+        index.build([r[0] if r else "" for r in values])
+        users = {}
+        for idx, r in enumerate(values, start=1):
+            uid = (r[0] if r else "").strip()
+            if not uid or index.get(uid) != idx:
+                continue
+            try:
+                bal = int(r[2] or 0) if len(r) > 2 else 0
+            except ValueError:
+                continue  # 헤더 등 숫자가 아닌 행
+            users[uid] = [r[1] if len(r) > 1 else "", bal, r[3] if len(r) > 3 else ""]
+        with self.lock:
+            self.index, self.loaded = index, True
+        return users
+
+    def push(self, rows):
+        # rows: [(uid, 이름, 소지금, 갱신시각)] — 있는 행은 C:D 갱신, 없는 행은 한 번에 추가
+        if not rows:
+            return 0
+        with self.lock:
+            sh = self.open_sheet()
+            if self.index.stale(sh):
+                # 관리자가 행을 지우거나 끼워 넣었으면 색인만 다시 만든다
+                self.index.build(sh.col_values(1))
+            updates = [{"range": f"C{self.index[r[0]]}:D{self.index[r[0]]}", "values": [list(r[2:4])]}
+                       for r in rows if r[0] in self.index]
+            new = [list(r) for r in rows if r[0] not in self.index]
+            if updates:
+                sh.batch_update(updates)
+            if new:
+                start = _first_row(sh.append_rows(new))
+                if start:
+                    for i, r in enumerate(new):
+                        self.index.add(r[0], start + i)
+                else:
+                    self.index.build(sh.col_values(1))
+            return len(rows)
+
+    def rewrite(self, rows, force=False):
+        # 시트를 rows 로 다시 씀 (1행 머리글 유지): update 한 번 + 남는 행 지우기 → (쓴 행, 남긴 행)
+        # rows 에 없는 uid의 행은 force 가 아니면 지우지 않고 시트 값 그대로 뒤에 붙여 남긴다
+        if not rows:
+            raise RuntimeError("장부 로그가 비어 있어 시트를 다시 쓰지 않습니다 (LEDGER_DB 경로를 확인하세요)")
+        with self.lock:
+            sh = self.open_sheet()
+            current = sh.get_all_values()
+            header = [current[0][0] if current and current[0] else "ID"]
+            values = [list(r) for r in rows]
+            kept = {}
+            if not force:
+                known = {r[0] for r in values}
+                for r in current[1:]:
+                    uid = (r[0] if r else "").strip()
+                    if uid and uid not in known and uid not in kept:
+                        r = (list(r) + [""] * 4)[:4]
+                        r[0] = uid
+                        if r[2].lstrip("-").isdigit(): r[2] = int(r[2])
+                        kept[uid] = r
+                values += kept.values()
+            sh.update(values, f"A2:D{len(values) + 1}")
+            if len(current) > len(values) + 1:
+                sh.batch_clear([f"A{len(values) + 2}:D{len(current)}"])
+            index = RowIndex(self.index.revalidate_interval)
+            index.build(header + [r[0] for r in values])
+            self.index, self.loaded = index, True
+            return len(values), len(kept)
+
+# ─────────────────────────────────────────────
+# 🗃️ LEDGER_DB 공통: 장부·로그·저널·전적이 같은 파일을 같은 설정으로 연다
+# ─────────────────────────────────────────────
+def _connect(path):
+    # LEDGER_DB 연결 공통 설정: 자동 커밋(트랜잭션은 _tx로), WAL, 다른 스레드에서 써도 됨
+    c = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    return c
+
+@contextmanager
+def _tx(c):
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        yield c
+    except BaseException:
+        c.execute("ROLLBACK")
+        raise
+    c.execute("COMMIT")
+
+# ─────────────────────────────────────────────
+# 🧾 장부 로그(WAL): 가입과 모든 잔액 변경을 먼저 로컬 SQLite에 한 줄씩 남김
+# 감사 기록이자, uid 별 마지막 줄만 모으면 시트를 통째로 다시 만들 수 있다.
+# op: seed(시트/DB에서 읽은 값) / register / set / add / settle (ref = 정산 키)
+# ─────────────────────────────────────────────
+LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_log (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    at      TEXT NOT NULL,
+    uid     TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    op      TEXT NOT NULL,
+    delta   INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    ref     TEXT
+);
+CREATE INDEX IF NOT EXISTS ledger_log_uid ON ledger_log(uid, seq);
+CREATE INDEX IF NOT EXISTS ledger_log_ref ON ledger_log(ref) WHERE ref IS NOT NULL;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def _log(c, rows):
+    # rows: [(시각, uid, 이름, op, 증감, 결과 잔액, ref)]
+    c.executemany("INSERT INTO ledger_log (at, uid, name, op, delta, balance, ref) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+def _settled(c, key):
+    # 이미 반영된 정산이면 {uid: 결과 잔액}, 아니면 None — 정산 키(ref)가 곧 멱등 기록
+    return dict(c.execute("SELECT uid, balance FROM ledger_log WHERE ref = ? AND op = 'settle'", (key,)).fetchall()) or None
+
+def _latest(c, after=0):
+    # uid 별 마지막 줄 [(uid, [이름, 소지금, 시각])] — 처음 나온 순서 (시트 행 순서)
+    return [(uid, [name, bal, at]) for uid, name, bal, at in c.execute(
+        "SELECT l.uid, l.name, l.balance, l.at FROM ledger_log l JOIN "
+        "(SELECT uid, MIN(seq) AS first, MAX(seq) AS last FROM ledger_log WHERE seq > ? GROUP BY uid) m "
+        "ON l.seq = m.last ORDER BY m.first", (after,))]
+
+class LedgerLog:
+    # 시트 장부(STORAGE_BACKEND=sheets)용: 시트에 쓰기 전에 변경을 로컬에 먼저 기록하고,
+    # 시트에 반영된 지점(synced_seq) 이후의 줄은 재시작 때 다시 적용한다
+    def __init__(self, path):
+        self.conn = _connect(path)
+        self.conn.executescript(LOG_SCHEMA)
+        self.lock = threading.Lock()
+        # 처음 쓰는 로그(또는 sqlite 백엔드에서 넘어온 기록)는 이미 시트에 있는 것으로 본다
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('synced_seq', ?)", (str(self.last_seq()),))
+
+    def append(self, rows):
+        if not rows:
+            return
+        with self.lock, _tx(self.conn) as c:
+            _log(c, rows)
+
+    def latest(self, after=0):
+        with self.lock:
+            return _latest(self.conn, after)
+
+    def settled(self, key):
+        with self.lock:
+            return _settled(self.conn, key)
+
+    def last_seq(self):
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM ledger_log").fetchone()[0]
+
+    def synced_seq(self):
+        with self.lock:
+            return int(self.conn.execute("SELECT value FROM meta WHERE key = 'synced_seq'").fetchone()[0])
+
+    def set_synced(self, seq):
+        with self.lock:
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'synced_seq' AND CAST(value AS INTEGER) < ?",
+                              (str(seq), seq))
+
+# ─────────────────────────────────────────────
+# 📒 시트 장부: 메모리에 두고 시트를 직접 원본으로 사용 (STORAGE_BACKEND=sheets)
+# ─────────────────────────────────────────────
+class BalanceLedger:
+    def __init__(self, mirror, flush_interval=5.0, log=None):
+        self.mirror = mirror
+        self.log = log      # LedgerLog — None 이면 로컬 기록 없이 메모리만
+        self.flush_interval = flush_interval  # 지연 쓰기 최대 간격(초)
+        self.users = {}     # uid -> [이름, 소지금, 갱신시각]
+        self.dirty = set()  # 시트에 반영 안 된 uid
+        self.holds = {}     # uid -> {정산 키: 묶어 둔 베팅액}
+        self.settled = OrderedDict()  # 최근 정산 키 -> 결과 (로그 조회 전에 먼저 확인)
+        self.ranking = []   # [(-소지금, uid)] 정렬 유지 — 순위는 이분 탐색 (복잡도는 아래 ── 순위 ── 참고)
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+
+    # ── 로드: 시트가 원본이므로 다 읽기 전에는 쓸 수 없음 ──
+    def open(self):
+        return False
+
+    def load(self):
+        users = self.mirror.load()
+        with self.lock:
+            # 로드 전에 생긴 변경은 유지
+            users.update(self.users)
+            if self.log:
+                # 시트에 반영되기 전에 멈췄던 변경을 로그에서 다시 적용
+                for uid, u in self.log.latest(self.log.synced_seq()):
+                    users[uid] = u
+                    self.dirty.add(uid)
+                # 로그와 다른 행(첫 실행, 시트 직접 수정)은 seed 로 남겨 로그만으로 시트를 재구성할 수 있게
+                known = {uid: u[1] for uid, u in self.log.latest()}
+                self.log.append([(u[2] or now_kst_str(), uid, u[0], "seed", 0, u[1], None)
+                                 for uid, u in users.items() if known.get(uid) != u[1]])
+            self.users = users
+            self.ranking = sorted((-u[1], uid) for uid, u in users.items())
+        return len(users)
+
+    # ── 조회/변경 (네트워크 없음) — 로그에 먼저 쓰고 메모리에 반영 ──
+    def _apply(self, rows):
+        if self.log:
+            self.log.append(rows)
+        for at, uid, uname, op, delta, bal, ref in rows:
+            u = self.users.get(uid)
+            if u is None:
+                u = self.users[uid] = [uname, bal, at]
+            else:
+                self._unrank(uid, u[1])
+            u[1], u[2] = bal, at
+            insort(self.ranking, (-bal, uid))
+            if op != "register" or uid not in self.mirror.index:
+                self.dirty.add(uid)
+
+    def _change(self, uid, uname, value, op, ref=None):
+        # 잔액을 value 로 바꾸는 로그 한 줄 (아직 적용 전)
+        self.ensure(uid, uname)
+        value = max(int(value), 0)
+        return (now_kst_str(), uid, uname, op, value - self.users[uid][1], value, ref)
+
+    def ensure(self, uid, uname):
+        with self.lock:
+            # 메모리에 있는 uid는 다시 등록하지 않음 (등록이 몰려도 시트 행은 하나)
+            if uid not in self.users:
+                self._apply([(now_kst_str(), uid, uname, "register", 0, START_BALANCE, None)])
+            return True
+
+    def get(self, uid, uname):
+        with self.lock:
+            self.ensure(uid, uname)
+            return self.users[uid][1]
+
+    def set(self, uid, uname, value):
+        with self.lock:
+            row = self._change(uid, uname, value, "set")
+            self._apply([row])
+            return row[5]
+
+    def add(self, uid, uname, delta):
+        with self.lock:
+            row = self._change(uid, uname, self.get(uid, uname) + int(delta), "add")
+            self._apply([row])
+            return row[5]
+
+    # ── 순위 ──
+    # 정렬된 파이썬 리스트: 순위 조회 O(log n), 쪽 조회 O(limit) 이지만
+    # 잔액이 바뀔 때마다 insort/del 이 O(n) 으로 원소를 옮긴다 (장부 잠금 안에서, memmove라 수만 명까지는 µs 단위)
+    def _unrank(self, uid, bal):
+        i = bisect_left(self.ranking, (-bal, uid))
+        if i < len(self.ranking) and self.ranking[i] == (-bal, uid):
+            del self.ranking[i]
+
+    def top(self, limit=10, offset=0):
+        # [(uid, 이름, 소지금)] 소지금 내림차순
+        with self.lock:
+            return [(uid, self.users[uid][0], -nb) for nb, uid in self.ranking[offset:offset + limit]]
+
+    def rank(self, uid):
+        # (순위, 전체 인원) — 같은 소지금은 같은 순위, 없는 uid는 None
+        with self.lock:
+            u = self.users.get(uid)
+            if u is None:
+                return None
+            return bisect_left(self.ranking, (-u[1], "")) + 1, len(self.ranking)
+
+    # ── 베팅 예치: 참가 시 금액을 묶어 여러 테이블에서 중복 사용 못 하게 함 ──
+    def available(self, uid, uname):
+        with self.lock:
+            return self.get(uid, uname) - sum(self.holds.get(uid, {}).values())
+
+    def reserve(self, key, uid, uname, amount):
+        with self.lock:
+            h = self.holds.get(uid, {})
+            if int(amount) > self.available(uid, uname) + h.get(key, 0):
+                return False
+            self.holds.setdefault(uid, {})[key] = int(amount)
+            return True
+
+    def release(self, key, uid=None):
+        with self.lock:
+            for u in ([uid] if uid else list(self.holds)):
+                h = self.holds.get(u)
+                if h and h.pop(key, None) is not None and not h:
+                    del self.holds[u]
+
+    def prune_holds(self, keep):
+        with self.lock:
+            for u in list(self.holds):
+                h = {k: v for k, v in self.holds[u].items() if k in keep}
+                if h: self.holds[u] = h
+                else: del self.holds[u]
+
+    def settle(self, key, entries):
+        # entries: [(uid, 이름, 증감)] — 한 판의 정산을 한꺼번에 적용하고 예치금을 푼다.
+        # 같은 key로 다시 불리면 아무것도 바꾸지 않고 처음 결과를 돌려준다 (재시작 뒤에도 로그로 확인).
+        with self.lock:
+            if key in self.settled:
+                return self.settled[key]
+            done = self.log.settled(key) if self.log else None
+            if done is not None:
+                self.release(key)
+                return done
+            rows = [self._change(uid, uname, self.get(uid, uname) + int(delta), "settle", key)
+                    for uid, uname, delta in entries]
+            self._apply(rows)
+            result = {row[1]: row[5] for row in rows}
+            self.release(key)
+            self.settled[key] = result
+            while len(self.settled) > SETTLED_KEEP:
+                self.settled.popitem(last=False)
+            return result
+
+    # ── 시트 반영 ──
+    def flush(self):
+        if not self.mirror.loaded:
+            return 0
+        with self.flush_lock:
+            with self.lock:
+                uids, self.dirty = self.dirty, set()
+                rows = [(u, *self.users[u]) for u in uids]
+                seq = self.log.last_seq() if self.log else 0
+            try:
+                n = self.mirror.push(rows)
+            except Exception:
+                with self.lock:
+                    self.dirty |= uids
+                raise
+            if self.log:
+                self.log.set_synced(seq)
+            return n
+
+    def rebuild_sheet(self, force=False):
+        # 로그의 uid 별 마지막 잔액으로 시트를 다시 씀 (시트가 망가졌을 때) — force 면 로그에 없는 행도 지움
+        if self.log is None:
+            raise RuntimeError("장부 로그가 없어 시트를 재구성할 수 없습니다")
+        with self.flush_lock, self.lock:
+            seq = self.log.last_seq()
+            n = self.mirror.rewrite([(uid, *u) for uid, u in self.log.latest()], force)
+            self.dirty.clear()
+            self.log.set_synced(seq)
+            return n
+
+# ─────────────────────────────────────────────
+# 🗄️ SQLite 장부: 로컬 WAL DB가 원본, 시트는 비동기 미러 (STORAGE_BACKEND=sqlite)
+# ─────────────────────────────────────────────
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid        TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    balance    INTEGER NOT NULL,
+    updated    TEXT NOT NULL,
+    ver        INTEGER NOT NULL DEFAULT 1,
+    synced_ver INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_unsynced ON users(uid) WHERE ver > synced_ver;
+CREATE INDEX IF NOT EXISTS users_balance ON users(balance DESC, uid);
+CREATE TABLE IF NOT EXISTS holds (
+    key    TEXT NOT NULL,
+    uid    TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (key, uid)
+);
+CREATE INDEX IF NOT EXISTS holds_uid ON holds(uid);
+""" + LOG_SCHEMA
+
+class SQLiteLedger:
+    def __init__(self, path, mirror=None, flush_interval=5.0):
+        self.path = path
+        self.mirror = mirror                  # None 이면 시트로 내보내지 않음
+        self.flush_interval = flush_interval
+        self.local = threading.local()        # 스레드마다 연결 하나
+        self.flush_lock = threading.Lock()
+
+    def conn(self):
+        c = getattr(self.local, "conn", None)
+        if c is None:
+            c = self.local.conn = _connect(self.path)
+        return c
+
+    def tx(self):
+        return _tx(self.conn())
+
+    # ── 열기(로컬, 즉시) / 로드(시트, 백그라운드) ──
+    def open(self):
+        # 이미 시트로 채워진 DB면 바로 사용 가능
+        self.conn().executescript(SCHEMA)
+        with self.tx() as c:
+            # 로그가 생기기 전의 DB: 현재 잔액을 seed 로 한 번 기록
+            if c.execute("SELECT 1 FROM ledger_log LIMIT 1").fetchone() is None:
+                c.execute("INSERT INTO ledger_log (at, uid, name, op, delta, balance) "
+                          "SELECT updated, uid, name, 'seed', 0, balance FROM users")
+            return self._seeded(c)
+
+    def _seeded(self, c):
+        return (c.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is not None
+                or c.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None)
+
+    def load(self):
+        # 미러가 있으면 시트를 읽어 색인을 만들고, DB가 처음이면 한 번 채움
+        self.open()
+        users = self.mirror.load() if self.mirror else None
+        with self.tx() as c:
+            if not self._seeded(c):
+                if users is None:
+                    raise RuntimeError("공유 DB가 아직 시트로 채워지지 않았습니다")
+                c.executemany(
+                    "INSERT INTO users (uid, name, balance, updated, ver, synced_ver) VALUES (?, ?, ?, ?, 1, 1)",
+                    [(uid, *u) for uid, u in users.items()])
+                _log(c, [(u[2] or now_kst_str(), uid, u[0], "seed", 0, u[1], None) for uid, u in users.items()])
+                c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded', ?)", (now_kst_str(),))
+            return c.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # ── 조회/변경 ──
+    # 변경은 모두 같은 트랜잭션 안에서 ledger_log 에도 기록
+    def _ensure(self, c, uid, uname):
+        now = now_kst_str()
+        if c.execute("INSERT OR IGNORE INTO users (uid, name, balance, updated) VALUES (?, ?, ?, ?)",
+                     (uid, uname, START_BALANCE, now)).rowcount:
+            _log(c, [(now, uid, uname, "register", 0, START_BALANCE, None)])
+
+    def _set(self, c, uid, uname, value, op, ref=None):
+        self._ensure(c, uid, uname)
+        now, value = now_kst_str(), max(int(value), 0)
+        old = c.execute("SELECT balance FROM users WHERE uid = ?", (uid,)).fetchone()[0]
+        c.execute("UPDATE users SET balance = ?, updated = ?, ver = ver + 1 WHERE uid = ?", (value, now, uid))
+        _log(c, [(now, uid, uname, op, value - old, value, ref)])
+        return value
+
+    def _add(self, c, uid, uname, delta, op="add", ref=None):
+        self._ensure(c, uid, uname)
+        bal = c.execute("SELECT balance FROM users WHERE uid = ?", (uid,)).fetchone()[0]
+        return self._set(c, uid, uname, bal + int(delta), op, ref)
+
+    def ensure(self, uid, uname):
+        with self.tx() as c:
+            self._ensure(c, uid, uname)
+        return True
+
+    def get(self, uid, uname):
+        row = self.conn().execute("SELECT balance FROM users WHERE uid = ?", (uid,)).fetchone()
+        if row is None:
+            self.ensure(uid, uname)
+            return START_BALANCE
+        return row[0]
+
+    def set(self, uid, uname, value):
+        with self.tx() as c:
+            return self._set(c, uid, uname, value, "set")
+
+    def add(self, uid, uname, delta):
+        with self.tx() as c:
+            return self._add(c, uid, uname, delta)
+
+    # ── 순위 (users_balance 색인) ──
+    # B-트리 색인을 앞에서부터 훑으므로 쪽 조회는 O(log n + offset + limit), 순위는 O(log n + 위 순위 수)
+    # (SQLite는 구간 개수를 세는 색인이 없음) — 잔액 갱신은 색인 갱신 O(log n)
+    def top(self, limit=10, offset=0):
+        return self.conn().execute("SELECT uid, name, balance FROM users ORDER BY balance DESC, uid LIMIT ? OFFSET ?",
+                                   (limit, offset)).fetchall()
+
+    def rank(self, uid):
+        c = self.conn()
+        row = c.execute("SELECT balance FROM users WHERE uid = ?", (uid,)).fetchone()
+        if row is None:
+            return None
+        higher = c.execute("SELECT COUNT(*) FROM users WHERE balance > ?", (row[0],)).fetchone()[0]
+        return higher + 1, c.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # ── 베팅 예치 ──
+    def _available(self, c, uid, except_key=None):
+        bal = c.execute("SELECT balance FROM users WHERE uid = ?", (uid,)).fetchone()[0]
+        held = c.execute("SELECT COALESCE(SUM(amount), 0) FROM holds WHERE uid = ? AND key IS NOT ?",
+                         (uid, except_key)).fetchone()[0]
+        return bal - held
+
+    def available(self, uid, uname):
+        with self.tx() as c:
+            self._ensure(c, uid, uname)
+            return self._available(c, uid)
+
+    def reserve(self, key, uid, uname, amount):
+        # 잔액 확인과 예치를 한 트랜잭션에서 (다른 채널/프로세스와 경쟁해도 초과 베팅 불가)
+        with self.tx() as c:
+            self._ensure(c, uid, uname)
+            if int(amount) > self._available(c, uid, key):
+                return False
+            c.execute("INSERT OR REPLACE INTO holds (key, uid, amount) VALUES (?, ?, ?)", (key, uid, int(amount)))
+            return True
+
+    def release(self, key, uid=None):
+        with self.tx() as c:
+            if uid:
+                c.execute("DELETE FROM holds WHERE key = ? AND uid = ?", (key, uid))
+            else:
+                c.execute("DELETE FROM holds WHERE key = ?", (key,))
+
+    def prune_holds(self, keep):
+        # 복원되지 않은 (사라진) 게임의 예치금을 푼다
+        with self.tx() as c:
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS keep_keys (key TEXT PRIMARY KEY)")
+            c.execute("DELETE FROM keep_keys")
+            c.executemany("INSERT OR IGNORE INTO keep_keys VALUES (?)", [(k,) for k in keep])
+            c.execute("DELETE FROM holds WHERE key NOT IN (SELECT key FROM keep_keys)")
+
+    def settle(self, key, entries):
+        # 한 트랜잭션 안에서 중복 확인(ledger_log.ref) + 전원 반영 + 예치금 해제
+        with self.tx() as c:
+            result = _settled(c, key)
+            if result is None:
+                result = {uid: self._add(c, uid, uname, delta, "settle", key) for uid, uname, delta in entries}
+            c.execute("DELETE FROM holds WHERE key = ?", (key,))
+            return result
+
+    # ── 시트 미러로 내보내기 ──
+    def flush(self):
+        if self.mirror is None or not self.mirror.loaded:
+            return 0
+        with self.flush_lock:
+            rows = self.conn().execute(
+                "SELECT uid, name, balance, updated, ver FROM users WHERE ver > synced_ver").fetchall()
+            if not rows:
+                return 0
+            self.mirror.push([r[:4] for r in rows])
+            with self.tx() as c:
+                c.executemany("UPDATE users SET synced_ver = MAX(synced_ver, ?) WHERE uid = ?",
+                              [(r[4], r[0]) for r in rows])
+            return len(rows)
+
+    def rebuild_sheet(self, force=False):
+        # 로그의 uid 별 마지막 잔액으로 시트를 다시 씀 (시트가 망가졌을 때) — force 면 로그에 없는 행도 지움
+        if self.mirror is None:
+            raise RuntimeError("시트 미러가 없는 프로세스입니다")
+        with self.flush_lock:
+            with self.tx() as c:
+                rows = _latest(c)
+                vers = c.execute("SELECT uid, ver FROM users").fetchall()
+            n = self.mirror.rewrite([(uid, *u) for uid, u in rows], force)
+            with self.tx() as c:
+                c.executemany("UPDATE users SET synced_ver = MAX(synced_ver, ?) WHERE uid = ?",
+                              [(v, uid) for uid, v in vers])
+            return n
+
+# ─────────────────────────────────────────────
+# 📼 게임 저널: 진행 중인 테이블 상태를 채널마다 한 행으로 보관 (재시작 후 복원)
+# 샤드 프로세스들이 같은 파일을 공유하며, 각자 자기 길드의 행만 복원한다.
+# ─────────────────────────────────────────────
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    cid   TEXT PRIMARY KEY,
+    mode  TEXT NOT NULL,
+    sid   TEXT NOT NULL,
+    guild INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL
+);
+"""
+
+class GameJournal:
+    # 쓰기는 단일 스레드(submit)로 순서대로 — 같은 채널의 저장/삭제가 뒤바뀌지 않음
+    def __init__(self, path):
+        self.conn = _connect(path)
+        self.conn.executescript(JOURNAL_SCHEMA)
+        if "guild" not in [r[1] for r in self.conn.execute("PRAGMA table_info(games)")]:
+            self.conn.execute("ALTER TABLE games ADD COLUMN guild INTEGER NOT NULL DEFAULT 0")
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+
+    def save(self, cid, mode, sid, guild, state):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO games (cid, mode, sid, guild, state) VALUES (?, ?, ?, ?, ?)",
+                              (cid, mode, sid, guild, state))
+
+    def drop(self, cid, sid):
+        with self.lock:
+            self.conn.execute("DELETE FROM games WHERE cid = ? AND sid = ?", (cid, sid))
+
+    def load(self):
+        # [(cid, mode, sid, guild, 상태 문자열)] — 여러 프로세스가 같은 DB를 공유하므로 전부 돌려줌
+        with self.lock:
+            return self.conn.execute("SELECT cid, mode, sid, guild, state FROM games").fetchall()
+
+    def submit(self, fn, *args):
+        fut = self.writer.submit(fn, *args)
+        fut.add_done_callback(_log_failure)
+        return fut
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+
+# ─────────────────────────────────────────────
+# 🏅 전적: 판이 끝날 때 플레이어마다 한 줄 (추가만), 유저별 누적은 같은 트랜잭션에서 갱신
+# 결과 코드 — 0: 승리, 1: 패배, 2: 버스트(패배)
+# ─────────────────────────────────────────────
+RECORDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid   TEXT NOT NULL,
+    sid   TEXT NOT NULL,
+    at    INTEGER NOT NULL,
+    mode  TEXT NOT NULL,
+    code  INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    delta INTEGER NOT NULL,
+    UNIQUE (uid, sid)
+);
+CREATE INDEX IF NOT EXISTS history_uid ON history(uid, seq);
+CREATE TABLE IF NOT EXISTS stats (
+    uid    TEXT PRIMARY KEY,
+    games  INTEGER NOT NULL DEFAULT 0,
+    wins   INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    busts  INTEGER NOT NULL DEFAULT 0,
+    net    INTEGER NOT NULL DEFAULT 0
+);
+"""
+WIN, LOSS, BUST = 0, 1, 2
+
+class GameRecords:
+    # (uid, sid) 가 유일하므로 같은 판을 두 번 기록해도 누적은 한 번만 오른다
+    def __init__(self, path):
+        self.conn = _connect(path)
+        self.conn.executescript(RECORDS_SCHEMA)
+        self.lock = threading.Lock()
+
+    def record(self, sid, mode, rows):
+        # rows: [(uid, 결과 코드, 점수, 증감)]
+        at = int(time.time())
+        with self.lock, _tx(self.conn) as c:
+            for uid, code, score, delta in rows:
+                if not c.execute("INSERT OR IGNORE INTO history (uid, sid, at, mode, code, score, delta) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?)", (uid, sid, at, mode, code, score, delta)).rowcount:
+                    continue
+                c.execute("INSERT INTO stats (uid, games, wins, losses, busts, net) VALUES (?, 1, ?, ?, ?, ?) "
+                          "ON CONFLICT(uid) DO UPDATE SET games = games + 1, wins = wins + excluded.wins, "
+                          "losses = losses + excluded.losses, busts = busts + excluded.busts, net = net + excluded.net",
+                          (uid, int(code == WIN), int(code != WIN), int(code == BUST), delta))
+
+    def stats(self, uid):
+        # (판 수, 승, 패, 버스트, 누적 증감) 또는 None
+        with self.lock:
+            return self.conn.execute("SELECT games, wins, losses, busts, net FROM stats WHERE uid = ?",
+                                     (uid,)).fetchone()
+
+    def history(self, uid, before=None, limit=10, after=None):
+        # 최신순 한 쪽: [(seq, 시각, 모드, 결과 코드, 점수, 증감)] — 다음 쪽은 before=마지막 seq,
+        # 이전 쪽은 after=첫 seq (after 보다 새 기록 중 가장 오래된 limit 개)
+        with self.lock:
+            if after is not None:
+                return self.conn.execute(
+                    "SELECT seq, at, mode, code, score, delta FROM history WHERE uid = ? AND seq > ? "
+                    "ORDER BY seq LIMIT ?", (uid, after, limit)).fetchall()[::-1]
+            return self.conn.execute(
+                "SELECT seq, at, mode, code, score, delta FROM history WHERE uid = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?", (uid, before or 2**62, limit)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def _log_failure(fut):
+    if fut.exception():
+        print(f"⚠️ 게임 저널 기록 실패: {fut.exception()!r}")
+
+# ─────────────────────────────────────────────
+# ⏳ 비동기 창구: 저장소 I/O는 전용 스레드 풀에서 실행
+# ─────────────────────────────────────────────
+_DEFAULT = object()
+
+class AsyncStore:
+    def __init__(self, ledger, workers=4, timeout=10.0):
+        self.ledger = ledger
+        self.timeout = timeout  # 호출별 대기 한도(초)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage")
+        self.locks = weakref.WeakValueDictionary()  # uid -> asyncio.Lock
+        self.ready = asyncio.Event()  # 장부를 읽을 수 있게 되면 set (그 전 호출은 대기)
+
+    async def run(self, fn, *args, timeout=_DEFAULT):
+        # timeout=None 이면 한도 없이 기다림
+        loop = asyncio.get_running_loop()
+        with STORAGE_SECONDS.time(op=fn.__name__):
+            fut = loop.run_in_executor(self.executor, fn, *args)
+            return await asyncio.wait_for(fut, self.timeout if timeout is _DEFAULT else timeout)
+
+    async def call(self, fn, *args):
+        # 장부 준비 전이면 (남은 한도 안에서) 기다렸다가 실행
+        if not self.ready.is_set():
+            await asyncio.wait_for(self.ready.wait(), self.timeout)
+        return await self.run(fn, *args)
+
+    async def ensure_user_row(self, uid, uname):
+        return await self.call(self.ledger.ensure, uid, uname)
+
+    async def get_balance(self, uid, uname):
+        return await self.call(self.ledger.get, uid, uname)
+
+    async def set_balance(self, uid, uname, value):
+        return await self.call(self.ledger.set, uid, uname, value)
+
+    async def add_balance(self, uid, uname, delta):
+        return await self.call(self.ledger.add, uid, uname, delta)
+
+    def user_lock(self, uid):
+        # 같은 유저의 여러 단계짜리 작업(예치 + 세션 등록)을 순서대로 처리.
+        # 유저마다 따로 잠그므로 다른 유저/테이블은 기다리지 않는다.
+        lock = self.locks.get(uid)
+        if lock is None:
+            lock = self.locks[uid] = asyncio.Lock()
+        return lock
+
+    async def available(self, uid, uname):
+        return await self.call(self.ledger.available, uid, uname)
+
+    async def reserve(self, key, uid, uname, amount):
+        return await self.call(self.ledger.reserve, key, uid, uname, amount)
+
+    async def release(self, key, uid=None):
+        return await self.call(self.ledger.release, key, uid)
+
+    async def top(self, limit=10, offset=0):
+        return await self.call(self.ledger.top, limit, offset)
+
+    async def rank(self, uid):
+        return await self.call(self.ledger.rank, uid)
+
+    async def settle(self, key, entries):
+        # 장부에만 한 번에 반영 — 시트에는 주기적 반영(ledger_flusher)이 다른 변경과 함께 쓴다
+        return await self.call(self.ledger.settle, key, entries)
+
+    async def flush(self, timeout=_DEFAULT):
+        return await self.run(self.ledger.flush, timeout=timeout)
+
+    def close(self):
+        self.executor.shutdown(wait=True)